@@ -3,8 +3,14 @@ import pandas as pd
 import numpy as np
 import plotly.graph_objects as go
 import itertools
+from math import lgamma
 from datetime import datetime
 from io import BytesIO
+from concurrent.futures import ThreadPoolExecutor
+import os
+import hashlib
+import threading
+from streamlit.runtime.scriptrunner import add_script_run_ctx, get_script_run_ctx
 
 st.set_page_config(page_title="LNP-Flow: Professional DOE Designer", page_icon="🀄", layout="wide")
 
@@ -229,6 +235,48 @@ with col_add3:
         help="Number of ionizable amine groups per lipid"
     )
 
+# Stock, scale and ratio settings used for every run unless promoted to a DOE factor
+volume_params = {
+    "mw_ion": mw_ionizable, "mw_helper": mw_helper, "mw_chol": mw_chol, "mw_peg": mw_peg,
+    "conc_ion": conc_ionizable, "conc_helper": conc_helper, "conc_chol": conc_chol, "conc_peg": conc_peg,
+    "dna_mass_ug": dna_mass_ug,
+    "dna_concentration": dna_concentration,
+    "ionizable_lipid_to_dna_ratio": ionizable_lipid_to_dna_ratio,
+    "aqueous_to_ethanol_ratio": aqueous_to_ethanol_ratio,
+    "ionizable_lipid_ratio": ionizable_lipid_ratio,
+    "helper_lipid_ratio": helper_lipid_ratio,
+    "cholesterol_ratio": cholesterol_ratio,
+    "pegdmg2000_ratio": pegdmg2000_ratio,
+    "amines_per_molecule": amines_per_molecule
+}
+
+# Formulation and process settings that can be promoted to DOE factors:
+# design column -> (label, volume_params key)
+PROCESS_FACTORS = {
+    "Helper_%": ("Helper Lipid %", "helper_lipid_ratio"),
+    "Aq_EtOH_Ratio": ("Aqueous:Ethanol Ratio", "aqueous_to_ethanol_ratio"),
+    "DNA_Mass_ug": ("DNA Scale (μg)", "dna_mass_ug"),
+    "Ion_Stock_ug_uL": ("Ionizable Stock (μg/μL)", "conc_ion"),
+    "Helper_Stock_ug_uL": ("Helper Stock (μg/μL)", "conc_helper"),
+    "Chol_Stock_ug_uL": ("Cholesterol Stock (μg/μL)", "conc_chol"),
+    "PEG_Stock_ug_uL": ("PEG Stock (μg/μL)", "conc_peg"),
+    "DNA_Stock_ug_uL": ("DNA Stock (μg/μL)", "dna_concentration"),
+    "Amines_per_Molecule": ("Amines per Molecule", "amines_per_molecule"),
+}
+
+# Taguchi orthogonal arrays: name -> (runs, levels of each column in standard column order)
+TAGUCHI_ARRAYS = {
+    "L4": (4, (2,) * 3),
+    "L8": (8, (2,) * 7),
+    "L9": (9, (3,) * 4),
+    "L12": (12, (2,) * 11),
+    "L16": (16, (2,) * 15),
+    "L18": (18, (2,) + (3,) * 7),
+    "L27": (27, (3,) * 13),
+    "L36": (36, (2,) * 11 + (3,) * 12),
+    "L54": (54, (2,) + (3,) * 25),
+    "L81": (81, (3,) * 40),
+}
 
 st.markdown("---")
 
@@ -266,7 +314,15 @@ with st.expander("🎛️ Select Factors to Study", expanded=True):
     with col_f4:
         study_ion_dna = st.checkbox("Ion:DNA Mass Ratio", value=True)
     
-    num_factors = sum([study_ionizable, study_cholesterol, study_peg, study_ion_dna])
+    process_factors = st.multiselect(
+        "Process & stock parameters to study:",
+        options=[f for f in PROCESS_FACTORS if not (f == "Helper_%" and study_cholesterol)],
+        format_func=lambda f: PROCESS_FACTORS[f][0],
+        help="Promote fixed settings from Stage 1 to DOE factors (8-12 factor designs). "
+             "Helper % can be studied only when Cholesterol % is not; cholesterol then fills the balance to 100%."
+    )
+    
+    num_factors = sum([study_ionizable, study_cholesterol, study_peg, study_ion_dna]) + len(process_factors)
     
     if num_factors < 2:
         st.warning("⚠️ Select at least 2 factors for meaningful DOE")
@@ -316,6 +372,17 @@ with st.expander("📏 Define Factor Ranges (Low & High Levels)", expanded=True)
     else:
         factor_ranges["Ion_DNA_Ratio"] = ion_dna_range_default
     
+    if process_factors:
+        st.markdown("**Process & Stock Parameters**")
+        process_cols = st.columns(3)
+        for i, factor in enumerate(process_factors):
+            label, param_key = PROCESS_FACTORS[factor]
+            base_value = float(volume_params[param_key])
+            with process_cols[i % 3]:
+                low = st.number_input(f"{label} – Low", value=round(0.8 * base_value, 3), format="%.3f", key=f"range_low_{factor}")
+                high = st.number_input(f"{label} – High", value=round(1.2 * base_value, 3), format="%.3f", key=f"range_high_{factor}")
+            factor_ranges[factor] = (low, high)
+    
     # Check feasibility and suggest adjustments
     st.info("💡 **Tip**: Wider ranges explore more of design space but may include non-functional formulations. Narrow ranges focus on known good regions.")
     
@@ -369,6 +436,9 @@ with st.expander("📏 Define Factor Ranges (Low & High Levels)", expanded=True)
             """)
         else:
             st.success(f"✅ **Optimal**: Your ranges are feasible. All 2^n combinations will be valid. Helper range: {min_helper_possible:.1f}% - 100%")
+        
+        # Filled once the volume helpers are defined (see volume_params below)
+        ion_dna_limit_slot = st.container()
 
 st.markdown("---")
 
@@ -390,8 +460,8 @@ with st.container():
             recommended_designs = ["Fractional Factorial", "Box-Behnken", "Plackett-Burman", "Central Composite"]
             design_help = "With 4 factors, consider fractional or response surface designs to manage run count"
         else:
-            recommended_designs = ["Plackett-Burman", "Fractional Factorial"]
-            design_help = "With 5+ factors, use screening designs to identify the most important ones first"
+            recommended_designs = ["Plackett-Burman", "Fractional Factorial", "Definitive Screening (DSD)"]
+            design_help = "With 5+ factors, use screening designs to identify the most important ones first. Definitive screening also detects curvature"
         
         st.markdown("**Recommended Designs** 🌟")
         design_type = st.radio(
@@ -406,15 +476,29 @@ with st.container():
             "Full Factorial (3-Level)",
             "Fractional Factorial",
             "Plackett-Burman",
+            "Definitive Screening (DSD)",
+            "Taguchi Orthogonal Array",
             "Box-Behnken",
             "Central Composite",
-            "Mixture Design"
+            "Mixture Design",
+            "Mixture Design (Extreme Vertices)",
+            "Mixture Design (Uniform Simplex Sampling)",
+            "Latin Hypercube (Maximin)",
+            "Low-Discrepancy (Sobol/Halton)",
+            "D-Optimal (Custom Run Count)",
+            "I-Optimal (Prediction Variance)",
+            "Split-Plot (Hard-to-Change Factors)"
         ]
+        if num_factors < 3:
+            all_designs.remove("Definitive Screening (DSD)")  # needs a conference matrix of order 4 or more
         other_designs = [d for d in all_designs if d not in recommended_designs]
         if other_designs:
             design_type_other = st.selectbox("Or choose from other designs:", options=["None"] + other_designs)
             if design_type_other != "None":
                 design_type = design_type_other
+        
+        # Filled once the design helpers are defined (see design comparison below)
+        design_compare_slot = st.container()
     
     with col_params:
         st.markdown("**Experimental Parameters**")
@@ -432,23 +516,342 @@ with st.container():
             max_value=4,
             help="Divide experiments across different days/batches"
         )
+        run_order_scheme = st.selectbox(
+            "Run Order:",
+            options=["Design order", "Complete randomization", "Randomize within blocks", "Separated replicates", "Orthogonal blocks (CCD/BBD)"],
+            index=2,
+            help="Randomizing the run order keeps time trends (reagent ageing, instrument drift) from being confounded with factor effects. "
+                 "Separated replicates run every design point once per pass; orthogonal blocks split a CCD or BBD into blocks that do not bias the model"
+        )
+        run_order_seed = st.number_input(
+            "Run Order Seed:",
+            value=1,
+            min_value=0,
+            step=1,
+            disabled=(run_order_scheme == "Design order"),
+            help="Fix the seed to reproduce the same run order"
+        )
+        
+        # Keyword options for the selected generator; design-specific widgets below fill them in
+        design_options = {"min_helper_pct": 0.5, "volume_params": volume_params} if design_type == "Full Factorial (3-Level)" else {}
+        
+        if design_type == "Box-Behnken":
+            bbd_center_points = st.number_input(
+                "Center Points:",
+                value=3,
+                min_value=1,
+                max_value=12,
+                help="Replicated center runs used to estimate pure error and curvature"
+            )
+            design_options = {"n_center": int(bbd_center_points)}
+        
+        if design_type == "Definitive Screening (DSD)":
+            dsd_center_points = st.number_input(
+                "Center Points:",
+                value=1,
+                min_value=1,
+                max_value=8,
+                key="dsd_center_points",
+                help="The design has one center run; extra center runs add pure-error degrees of freedom"
+            )
+            design_options = {"n_center": int(dsd_center_points)}
+        
+        if design_type == "Taguchi Orthogonal Array":
+            studied_factors = [f for f, studied in [("Ionizable_%", study_ionizable), ("Cholesterol_%", study_cholesterol),
+                                                     ("PEG_%", study_peg), ("Ion_DNA_Ratio", study_ion_dna)] if studied] + process_factors
+            oa_three_level = st.multiselect(
+                "3-Level Factors:",
+                options=studied_factors,
+                format_func=lambda f: PROCESS_FACTORS[f][0] if f in PROCESS_FACTORS else f,
+                help="Low / mid / high settings; all other factors use low / high"
+            )
+            oa_interactions = st.multiselect(
+                "Interactions to Keep Clear:",
+                options=list(itertools.combinations(studied_factors, 2)),
+                format_func=lambda pair: f"{pair[0]} × {pair[1]}",
+                help="Their interaction columns are left unassigned (linear arrays L4, L8, L9, L16, L27, L81 only)"
+            )
+            n_three = len(oa_three_level)
+            fitting_arrays = [
+                name for name, (_, levels) in TAGUCHI_ARRAYS.items()
+                if levels.count(3) >= n_three and len(levels) >= len(studied_factors) + len(oa_interactions)
+                and (not oa_interactions or name not in ("L12", "L18", "L36", "L54"))
+            ] or list(TAGUCHI_ARRAYS)
+            oa_array = st.selectbox(
+                "Orthogonal Array:",
+                options=list(TAGUCHI_ARRAYS),
+                index=list(TAGUCHI_ARRAYS).index(fitting_arrays[0]),
+                format_func=lambda name: f"{name} ({TAGUCHI_ARRAYS[name][0]} runs: "
+                                         + " ".join(f"{l}^{TAGUCHI_ARRAYS[name][1].count(l)}" for l in (2, 3) if l in TAGUCHI_ARRAYS[name][1]) + ")",
+                help="Defaults to the smallest array with enough columns"
+            )
+            design_options = {"array": oa_array, "three_level_factors": tuple(oa_three_level), "interactions": tuple(oa_interactions)}
+        
+        if design_type == "Central Composite":
+            ccd_variant = st.selectbox(
+                "CCD Variant:",
+                options=["CCC", "CCI", "CCF"],
+                format_func=lambda v: {
+                    "CCC": "CCC - Circumscribed (axial points outside range)",
+                    "CCI": "CCI - Inscribed (all points inside range)",
+                    "CCF": "CCF - Face-centered (alpha = 1)"
+                }[v],
+                help="Choose where the axial (star) points are placed relative to the factor ranges"
+            )
+            ccd_alpha_type = st.radio(
+                "Axial Distance (alpha):",
+                options=["Rotatable", "Orthogonal"],
+                horizontal=True,
+                disabled=(ccd_variant == "CCF"),
+                help="Rotatable: equal prediction variance at equal distance from center. Orthogonal: uncorrelated quadratic terms"
+            )
+            ccd_center_points = st.number_input(
+                "Center Points:",
+                value=3,
+                min_value=1,
+                max_value=12,
+                key="ccd_center_points",
+                help="Replicated center runs used to estimate pure error and curvature"
+            )
+            ccd_fractional = False
+            if 5 <= num_factors <= 10:
+                ccd_fractional = st.checkbox(
+                    "Use resolution V fractional factorial core",
+                    value=True,
+                    help="Halves (or better) the factorial portion while keeping main effects and two-factor interactions clear"
+                )
+            design_options = {
+                "variant": ccd_variant, "alpha_type": ccd_alpha_type,
+                "n_center": int(ccd_center_points), "fractional": ccd_fractional
+            }
+        
+        if design_type == "Mixture Design":
+            mixture_type = st.selectbox(
+                "Mixture Type:",
+                options=["Simplex Lattice", "Simplex Centroid"],
+                key="mixture_type",
+                help="Lattice: proportions on a {q, m} grid. Centroid: blends of every subset of lipids in equal parts"
+            )
+            mixture_degree = st.number_input(
+                "Lattice Degree (m):",
+                value=2,
+                min_value=1,
+                max_value=6,
+                key="mixture_degree",
+                disabled=(mixture_type == "Simplex Centroid"),
+                help="Proportions take the values 0, 1/m, 2/m, ..., 1 in pseudo-components"
+            )
+            design_options = {"mixture_type": mixture_type, "degree": int(mixture_degree), "min_helper_pct": 0.5}
+        
+        if design_type == "Mixture Design (Extreme Vertices)":
+            ev_point_types = st.multiselect(
+                "Point Types:",
+                options=["Vertices", "Edge centroids", "Face centroids", "Overall centroid"],
+                default=["Vertices", "Edge centroids", "Face centroids", "Overall centroid"],
+                help="Vertices of the constrained lipid simplex plus centroids of its edges, faces and the whole region"
+            )
+            ev_max_helper = st.number_input(
+                "Max Helper Lipid (%):",
+                value=100.0,
+                min_value=0.5,
+                max_value=100.0,
+                step=0.5,
+                help="Upper bound on the helper lipid (100 = no extra limit); the lower bound is the 0.5% minimum"
+            )
+            design_options = {"min_helper_pct": 0.5, "max_helper_pct": ev_max_helper, "point_types": ev_point_types}
+        
+        if design_type == "Mixture Design (Uniform Simplex Sampling)":
+            simplex_runs = st.number_input(
+                "Number of Formulations:",
+                value=384,
+                min_value=4,
+                max_value=5000,
+                step=1,
+                key="simplex_runs",
+                help="Exact number of feasible compositions, e.g. 96 or 384 for a well plate"
+            )
+            simplex_max_helper = st.number_input(
+                "Max Helper Lipid (%):",
+                value=100.0,
+                min_value=0.5,
+                max_value=100.0,
+                step=0.5,
+                key="simplex_max_helper",
+                help="Upper bound on the helper lipid (100 = no extra limit); the lower bound is the 0.5% minimum"
+            )
+            simplex_seed = st.number_input(
+                "Random Seed:",
+                value=42,
+                min_value=0,
+                step=1,
+                key="simplex_seed",
+                help="Fix the seed to reproduce the same library"
+            )
+            design_options = {
+                "n_runs": int(simplex_runs), "min_helper_pct": 0.5, "max_helper_pct": simplex_max_helper,
+                "seed": int(simplex_seed), "volume_params": volume_params
+            }
+        
+        if design_type == "Latin Hypercube (Maximin)":
+            lhs_runs = st.number_input(
+                "Number of Formulations:",
+                value=96,
+                min_value=4,
+                max_value=50000,
+                step=1,
+                key="lhs_runs",
+                help="Exact number of feasible design points, e.g. 96 or 384 for a well plate"
+            )
+            lhs_seed = st.number_input(
+                "Random Seed:",
+                value=42,
+                min_value=0,
+                step=1,
+                key="lhs_seed",
+                help="Fix the seed to reproduce the same design"
+            )
+            design_options = {"n_runs": int(lhs_runs), "min_helper_pct": 0.5, "seed": int(lhs_seed)}
+        
+        if design_type == "Low-Discrepancy (Sobol/Halton)":
+            ld_method = st.selectbox(
+                "Sequence:",
+                options=["Sobol", "Halton"],
+                help="Sobol is generally more uniform; Halton works for any run count"
+            )
+            ld_scramble = st.selectbox(
+                "Scrambling:",
+                options=["Owen", "Random shift", "None"],
+                help="Owen-type scrambling (random digit scrambles) removes lattice artefacts; random shift is cheaper"
+            )
+            ld_runs = st.number_input(
+                "Number of Formulations:",
+                value=384,
+                min_value=4,
+                max_value=100000,
+                step=1,
+                key="ld_runs",
+                help="Exact number of feasible design points"
+            )
+            ld_skip = st.number_input(
+                "Start Index (skip):",
+                value=0,
+                min_value=0,
+                step=1,
+                help="Skip the first points of the sequence. Use the reported next index to extend an earlier screen without repeats"
+            )
+            ld_seed = st.number_input(
+                "Scramble Seed:",
+                value=0,
+                min_value=0,
+                step=1,
+                key="ld_seed",
+                help="Keep the same seed when extending a screen"
+            )
+            design_options = {
+                "n_runs": int(ld_runs), "method": ld_method, "skip": int(ld_skip),
+                "scramble": ld_scramble, "seed": int(ld_seed), "min_helper_pct": 0.5
+            }
+        
+        if design_type == "D-Optimal (Custom Run Count)":
+            dopt_model = st.selectbox(
+                "Model to Support:",
+                options=["Linear", "Interactions", "Quadratic", "Scheffé Quadratic"],
+                index=2,
+                help="The design maximizes det(X'X) for this model; Scheffé uses the four lipid proportions"
+            )
+            dopt_runs = st.number_input(
+                "Number of Runs:",
+                value=24,
+                min_value=2,
+                max_value=500,
+                step=1,
+                key="dopt_runs",
+                help="Your run budget, e.g. the number of LNPs you can make per day"
+            )
+            dopt_starts = st.number_input(
+                "Random Starts:",
+                value=8,
+                min_value=1,
+                max_value=64,
+                step=1,
+                help="Independent exchange runs (executed in parallel); the best design is kept"
+            )
+            design_options = {"n_runs": int(dopt_runs), "model": dopt_model, "n_starts": int(dopt_starts), "min_helper_pct": 0.5}
+        
+        if design_type == "I-Optimal (Prediction Variance)":
+            iopt_model = st.selectbox(
+                "Model to Predict:",
+                options=["Linear", "Interactions", "Quadratic", "Scheffé Quadratic"],
+                index=2,
+                help="The design minimizes the average prediction variance of this model over the feasible region"
+            )
+            iopt_runs = st.number_input(
+                "Number of Runs:",
+                value=30,
+                min_value=2,
+                max_value=500,
+                step=1,
+                key="iopt_runs",
+                help="Typical response-surface studies use 30-60 runs"
+            )
+            iopt_starts = st.number_input(
+                "Random Starts:",
+                value=4,
+                min_value=1,
+                max_value=32,
+                step=1,
+                key="iopt_starts",
+                help="Independent exchange runs (executed in parallel); the best design is kept"
+            )
+            design_options = {"n_runs": int(iopt_runs), "model": iopt_model, "n_starts": int(iopt_starts), "min_helper_pct": 0.5}
+        
+        if design_type == "Split-Plot (Hard-to-Change Factors)":
+            studied_factors = [f for f, studied in [("Ionizable_%", study_ionizable), ("Cholesterol_%", study_cholesterol),
+                                                     ("PEG_%", study_peg), ("Ion_DNA_Ratio", study_ion_dna)] if studied] + process_factors
+            default_whole_plot = [f for f in studied_factors if f in PROCESS_FACTORS and f != "Helper_%"] or studied_factors[-1:]
+            sp_whole_plot_factors = st.multiselect(
+                "Whole-Plot (Hard-to-Change) Factors:",
+                options=studied_factors,
+                default=default_whole_plot,
+                format_func=lambda f: PROCESS_FACTORS[f][0] if f in PROCESS_FACTORS else f,
+                help="Factors fixed for a whole batch, e.g. stock concentrations or the aqueous:ethanol ratio. "
+                     "All other factors are varied run to run inside each batch"
+            )
+            sp_col1, sp_col2 = st.columns(2)
+            with sp_col1:
+                sp_whole_plot_levels = st.selectbox("Whole-Plot Levels:", options=[2, 3], key="sp_whole_plot_levels")
+            with sp_col2:
+                sp_subplot_levels = st.selectbox("Subplot Levels:", options=[2, 3], key="sp_subplot_levels")
+            sp_whole_plot_replicates = st.number_input(
+                "Whole-Plot Replicates:",
+                value=2,
+                min_value=1,
+                max_value=6,
+                help="Independent preparations of each whole-plot setting; at least 2 are needed to estimate whole-plot error"
+            )
+            design_options = {
+                "whole_plot_factors": tuple(sp_whole_plot_factors), "whole_plot_levels": int(sp_whole_plot_levels),
+                "subplot_levels": int(sp_subplot_levels), "whole_plot_replicates": int(sp_whole_plot_replicates)
+            }
         
         st.markdown("**Design Statistics**")
-        design_info = {
-            "Full Factorial (2-Level)": (2**num_factors, "2^n"),
-            "Full Factorial (3-Level)": (3**num_factors, "3^n"),
-            "Fractional Factorial": (max(8, 2**(num_factors-1)), "2^(n-1)"),
-            "Plackett-Burman": (12, "12 runs"),
-            "Box-Behnken": (3*num_factors+4, "n-factor specific"),
-            "Central Composite": (2**num_factors + 2*num_factors + 1, "2^n + 2n + 1"),
-            "Mixture Design": (3**num_factors if num_factors <= 3 else 20, "Simplex lattice")
-        }
-        
-        base_runs, formula = design_info.get(design_type, (8, ""))
-        total_runs = base_runs * num_replicates * num_blocks
-        
-        st.metric("Base Design Runs", f"{base_runs} ({formula})")
-        st.metric("Total Runs (incl. replicates & blocks)", total_runs)
+        if "Mixture" in design_type:
+            default_diag_model = 3
+        elif design_type in ("Full Factorial (2-Level)", "Fractional Factorial", "Plackett-Burman",
+                             "Definitive Screening (DSD)", "Taguchi Orthogonal Array", "Split-Plot (Hard-to-Change Factors)"):
+            default_diag_model = 0 if design_type in ("Plackett-Burman", "Definitive Screening (DSD)", "Taguchi Orthogonal Array") else 1
+        else:
+            default_diag_model = 2
+        diagnostics_model = st.selectbox(
+            "Model for Diagnostics:",
+            options=["Linear", "Interactions", "Quadratic", "Scheffé Quadratic"],
+            index=default_diag_model,
+            key=f"diagnostics_model_{design_type}",
+            help="Efficiencies, VIFs and degrees of freedom are evaluated for this model on the feasible design points"
+        )
+        
+        # Filled once the design helpers are defined (see design diagnostics below)
+        design_stats_slot = st.container()
 
 st.markdown("---")
 
@@ -456,184 +859,2208 @@ st.markdown("---")
 # HELPER FUNCTIONS
 # ============================================================================
 
-def normalize_molar_ratios(ionizable_pct, cholesterol_pct, peg_pct):
+def filter_valid_design_points(design_df, min_helper_pct=0.5):
+    """
+    Filter DOE design points to ensure all molar ratios are valid.
+    
+    A valid combination requires:
+    Ionizable + Cholesterol + PEG + Helper = 100%
+    And Helper >= min_helper_pct (default 0.5%)
+    
+    This removes points where the sum of Ion + Chol + PEG > 100% - min_helper_pct
+    (Ion + Helper + PEG when Helper_% is studied and Cholesterol is the balance)
+    """
+    composition = [c for c in MIXTURE_COMPONENTS if c in design_df.columns]
+    if len(composition) < 3:
+        return design_df  # If not all columns present, return unchanged
+    
+    valid_mask = composition_feasible_mask(design_df[composition].to_numpy(), composition, min_helper_pct)
+    
+    filtered_df = design_df[valid_mask].reset_index(drop=True)
+    
+    # Report filtering results
+    n_original = len(design_df)
+    n_filtered = len(filtered_df)
+    n_removed = n_original - n_filtered
+    
+    if n_removed > 0:
+        st.warning(
+            f"⚠️ **Design Space Constraint**: {n_removed} of {n_original} design points removed "
+            f"because {' + '.join(c.replace('_%', '') for c in composition)} > 100%. "
+            f"Remaining valid points: {n_filtered}"
+        )
+    
+    return filtered_df
+
+
+COMPOSITION_FACTORS = ["Ionizable_%", "Cholesterol_%", "PEG_%"]
+
+# All four lipids of the mixture; Helper_% is the balance when it is not a design factor
+MIXTURE_COMPONENTS = ["Ionizable_%", "Helper_%", "Cholesterol_%", "PEG_%"]
+
+
+def composition_feasible_mask(values, factor_names, min_helper_pct=0.5):
+    """
+    Vectorized molar-sum check on a (n_points, n_factors) array in physical units.
+    A point is feasible when the studied lipid percentages sum to at most
+    100% - min_helper_pct, leaving room for the balance lipid (Helper_%, or
+    Cholesterol_% when Helper_% is a factor).
+    """
+    values = np.asarray(values, dtype=float)
+    comp_idx = [i for i, f in enumerate(factor_names) if f in MIXTURE_COMPONENTS]
+    if not comp_idx:
+        return np.ones(len(values), dtype=bool)
+    return values[:, comp_idx].sum(axis=1) <= (100.0 - min_helper_pct)
+
+
+def iter_factorial_chunks(ranges_dict, n_levels=3, chunk_size=65536, min_helper_pct=0.5, volume_params=None):
+    """
+    Stream a full factorial as DataFrames of feasible rows.
+
+    Each chunk is a contiguous range of run indices decoded into level digits by
+    mixed-radix arithmetic (first factor changes slowest), scaled to physical units,
+    and masked by the molar-sum check and, when volume_params is given, the
+    pipetting-volume check. Peak memory is bounded by chunk_size; the index of each
+    yielded row is its run index in the full enumeration.
+    """
+    factor_names = list(ranges_dict.keys())
+    n_factors = len(factor_names)
+    bounds = np.array([ranges_dict[f] for f in factor_names], dtype=float)
+    level_table = bounds[:, :1] + (bounds[:, 1:] - bounds[:, :1]) * np.linspace(0.0, 1.0, n_levels)
+    radix = n_levels ** np.arange(n_factors - 1, -1, -1, dtype=np.int64)
+    n_total = n_levels ** n_factors
+    
+    for start in range(0, n_total, chunk_size):
+        index = np.arange(start, min(start + chunk_size, n_total), dtype=np.int64)
+        digits = (index[:, None] // radix) % n_levels
+        values = level_table[np.arange(n_factors), digits]
+        
+        mask = composition_feasible_mask(values, factor_names, min_helper_pct)
+        if volume_params is not None:
+            mask &= volume_feasible_mask(values, factor_names, volume_params)
+        if mask.any():
+            yield pd.DataFrame(values[mask], columns=factor_names, index=index[mask])
+
+
+def generate_2level_factorial(ranges_dict):
+    """Generate 2-level full factorial design."""
+    return decode_coded_design(coded_design("2-level factorial", len(ranges_dict)), ranges_dict)
+
+
+def generate_3level_factorial(ranges_dict, min_helper_pct=0.5, volume_params=None, chunk_size=65536):
+    """
+    Generate 3-level full factorial design, streamed in chunks so only feasible
+    rows are ever materialized (3^12 = 531k combinations fit in one chunk's memory).
+    """
+    chunks = list(iter_factorial_chunks(
+        ranges_dict, n_levels=3, chunk_size=chunk_size,
+        min_helper_pct=min_helper_pct, volume_params=volume_params
+    ))
+    if chunks:
+        design_df = pd.concat(chunks).reset_index(drop=True)
+    else:
+        design_df = pd.DataFrame(columns=list(ranges_dict.keys()), dtype=float)
+    design_df.attrs["n_enumerated"] = 3 ** len(ranges_dict)
+    return design_df
+
+
+def generate_fractional_factorial(ranges_dict):
+    """Generate 2-level fractional factorial (resolution V for 5-10 factors, IV for 11-15)."""
+    return decode_coded_design(coded_design("fractional factorial", len(ranges_dict)), ranges_dict)
+
+
+def generate_plackett_burman(ranges_dict):
+    """Generate Plackett-Burman screening design."""
+    return decode_coded_design(coded_design("plackett-burman", len(ranges_dict)), ranges_dict)
+
+
+def generate_definitive_screening(ranges_dict, n_center=1):
+    """Generate a definitive screening design (2k + 1 runs, three levels) with n_center center runs in total."""
+    coded = coded_design("definitive screening", len(ranges_dict))
+    extra_centers = np.zeros((max(n_center - 1, 0), len(ranges_dict)), dtype=np.int8)
+    return decode_coded_design(np.vstack([coded, extra_centers]), ranges_dict)
+
+
+def generate_taguchi_design(ranges_dict, array="L18", three_level_factors=(), interactions=()):
+    """
+    Generate a Taguchi orthogonal array design: catalog lookup, column assignment
+    (keeping requested interaction columns free) and a vectorized decode. 2-level
+    factors placed on 3-level columns take the dummy level (middle -> high).
+    """
+    factor_levels = {f: 3 if f in three_level_factors else 2 for f in ranges_dict}
+    assignment, interaction_columns = assign_oa_columns(array, factor_levels, interactions)
+    _, levels = TAGUCHI_ARRAYS[array]
+    coded = coded_design(f"taguchi {array}", len(levels))[:, [assignment[f] - 1 for f in ranges_dict]]
+    dummy = np.array([factor_levels[f] == 2 and levels[assignment[f] - 1] == 3 for f in ranges_dict])
+    coded = np.where(dummy & (coded == 0), 1, coded)
+    
+    design_df = decode_coded_design(coded, ranges_dict)
+    design_df.attrs["column_assignment"] = assignment
+    design_df.attrs["interaction_columns"] = {f"{a} × {b}": columns for (a, b), columns in interaction_columns.items()}
+    return design_df
+
+
+def decode_coded_design(coded, ranges_dict):
+    """
+    Map a coded design matrix (-1 = low, 0 = center, +1 = high) onto the
+    physical factor ranges in a single broadcast.
+    """
+    factor_names = list(ranges_dict.keys())
+    bounds = np.array([ranges_dict[f] for f in factor_names], dtype=float)
+    center = bounds.mean(axis=1)
+    half_range = (bounds[:, 1] - bounds[:, 0]) / 2
+    return pd.DataFrame(center + np.asarray(coded, dtype=float) * half_range, columns=factor_names)
+
+
+# Incomplete block structures for Box-Behnken designs (0-based factor indices).
+# 3, 4, 5 and 8 factors use all factor pairs; 6 factors use the partially balanced
+# blocks of Box & Behnken (1960); 7 factors use the (7, 3, 1) BIBD, 9 factors the
+# (9, 3, 1) BIBD given by the lines of the affine plane AG(2, 3), and 10 factors a
+# cyclic partially balanced design developed from the base block {0, 1, 3, 5}.
+BBD_BLOCKS = {
+    6: [(0, 1, 3), (1, 2, 4), (2, 3, 5), (0, 3, 4), (1, 4, 5), (0, 2, 5)],
+    7: [(3, 4, 5), (0, 5, 6), (1, 4, 6), (0, 1, 3), (2, 3, 6), (0, 2, 4), (1, 2, 5)],
+    9: [(0, 1, 2), (3, 4, 5), (6, 7, 8), (0, 3, 6), (1, 4, 7), (2, 5, 8),
+        (0, 4, 8), (1, 5, 6), (2, 3, 7), (0, 5, 7), (1, 3, 8), (2, 4, 6)],
+    10: [tuple(sorted((i + d) % 10 for d in (0, 1, 3, 5))) for i in range(10)],
+}
+
+# Standard number of center points per factor count
+BBD_CENTER_POINTS = {3: 3, 4: 3, 5: 6, 6: 6, 7: 6, 8: 6, 9: 10, 10: 10}
+
+
+def box_behnken_coded(n_factors, n_center=None):
+    """
+    Build a coded Box-Behnken design as an int8 array.
+
+    Every incomplete block of factors is run as a 2^s factorial while the
+    remaining factors stay at their center level, followed by center points.
+    """
+    if not 3 <= n_factors <= 10:
+        raise ValueError("Box-Behnken designs are available for 3 to 10 factors")
+
+    if n_factors in BBD_BLOCKS:
+        blocks = np.array(BBD_BLOCKS[n_factors])
+    else:
+        blocks = np.array(list(itertools.combinations(range(n_factors), 2)))
+    if n_center is None:
+        n_center = BBD_CENTER_POINTS[n_factors]
+
+    n_blocks, block_size = blocks.shape
+    signs = np.array(list(itertools.product([-1, 1], repeat=block_size)), dtype=np.int8)
+
+    edges = np.zeros((n_blocks, len(signs), n_factors), dtype=np.int8)
+    edges[np.arange(n_blocks)[:, None, None], np.arange(len(signs))[None, :, None], blocks[:, None, :]] = signs[None, :, :]
+
+    return np.vstack([edges.reshape(-1, n_factors), np.zeros((n_center, n_factors), dtype=np.int8)])
+
+
+def generate_box_behnken(ranges_dict, n_center=None):
+    """Generate Box-Behnken design (3-10 factors) with configurable center points."""
+    n_factors = len(ranges_dict)
+    if n_center is None:
+        n_center = BBD_CENTER_POINTS.get(n_factors, 3)
+    coded = np.vstack([coded_design("box-behnken", n_factors), np.zeros((n_center, n_factors), dtype=np.int8)])
+    return decode_coded_design(coded, ranges_dict)
+
+
+# Fractional factorial generators of resolution V or higher, keyed by factor count.
+# Each tuple lists the base factors whose product defines one added factor.
+FRACTIONAL_FACTORIAL_GENERATORS = {
+    5: [(0, 1, 2, 3)],                            # 2^(5-1) V:  E = ABCD
+    6: [(0, 1, 2, 3, 4)],                         # 2^(6-1) VI: F = ABCDE
+    7: [(0, 1, 2, 3, 4, 5)],                      # 2^(7-1) VII: G = ABCDEF
+    8: [(0, 1, 2, 3), (0, 1, 4, 5)],              # 2^(8-2) V:  G = ABCD, H = ABEF
+    9: [(0, 2, 3, 5, 6), (1, 2, 4, 5, 6)],        # 2^(9-2) VI: H = ACDFG, J = BCEFG
+    10: [(0, 1, 2, 6), (1, 2, 3, 4), (0, 2, 3, 5)],  # 2^(10-3) V: H = ABCG, J = BCDE, K = ACDF
+}
+
+# 11-15 factors: 32-run resolution IV fractions. Every added factor is a three-factor
+# product of the five base factors, so all words in the defining relation have even length >= 4.
+FRACTIONAL_FACTORIAL_GENERATORS.update({
+    n_factors: list(itertools.combinations(range(5), 3))[:n_factors - 5]
+    for n_factors in range(11, 16)
+})
+
+
+def full_factorial_coded(n_factors):
+    """Coded 2-level full factorial in standard order as an int8 array."""
+    bits = (np.arange(2 ** n_factors)[:, None] >> np.arange(n_factors - 1, -1, -1)) & 1
+    return (2 * bits - 1).astype(np.int8)
+
+
+def fractional_factorial_coded(n_factors):
+    """
+    Coded fractional factorial: resolution V+ for 5-10 factors, IV for 11-15.
+    Falls back to the full factorial when no fraction is tabulated.
+    """
+    generators = FRACTIONAL_FACTORIAL_GENERATORS.get(n_factors)
+    if generators is None:
+        return full_factorial_coded(n_factors)
+    
+    base = full_factorial_coded(n_factors - len(generators))
+    added = np.column_stack([base[:, list(g)].prod(axis=1) for g in generators])
+    return np.hstack([base, added]).astype(np.int8)
+
+
+def ccd_alpha(n_factorial, n_factors, n_center, alpha_type="Rotatable"):
+    """
+    Axial distance of a central composite design.
+    Rotatable: alpha = F^(1/4); orthogonal: alpha = (Q*F/4)^(1/4) with Q = (sqrt(F+T) - sqrt(F))^2,
+    where F is the number of factorial runs and T the number of axial plus center runs.
+    """
+    if alpha_type == "Orthogonal":
+        q = (np.sqrt(n_factorial + 2 * n_factors + n_center) - np.sqrt(n_factorial)) ** 2
+        return (q * n_factorial / 4) ** 0.25
+    return n_factorial ** 0.25
+
+
+def central_composite_coded(n_factors, variant="CCC", alpha_type="Rotatable", n_center=3, fractional=False):
+    """
+    Build a coded central composite design by stacking the factorial core, axial
+    points and center replicates.
+
+    CCC places the factorial core at +/-1 and the axial points at +/-alpha,
+    CCI shrinks the whole design so the axial points sit at +/-1, and
+    CCF uses face-centered axial points (alpha = 1). The fractional (resolution V)
+    core is available for 5-10 factors; larger designs use the full factorial core.
+    """
+    skeleton = coded_design("ccd fractional" if fractional and 5 <= n_factors <= 10 else "ccd", n_factors)
+    n_core = len(skeleton) - 2 * n_factors
+    
+    alpha = 1.0 if variant == "CCF" else ccd_alpha(n_core, n_factors, n_center, alpha_type)
+    if variant == "CCI":
+        core_scale, axial_scale = 1.0 / alpha, 1.0
+    else:
+        core_scale, axial_scale = 1.0, alpha
+    
+    row_scale = np.repeat([core_scale, axial_scale], [n_core, 2 * n_factors])
+    return np.vstack([
+        skeleton * row_scale[:, None],
+        np.zeros((n_center, n_factors))
+    ])
+
+
+def generate_central_composite(ranges_dict, variant="CCC", alpha_type="Rotatable", n_center=3, fractional=False):
+    """Generate Central Composite Design (CCC, CCI or CCF)."""
+    coded = central_composite_coded(
+        len(ranges_dict), variant=variant, alpha_type=alpha_type,
+        n_center=n_center, fractional=fractional
+    )
+    return decode_coded_design(coded, ranges_dict)
+
+
+# Generating rows of the cyclic Plackett-Burman designs whose run count is not a power of two
+PLACKETT_BURMAN_GENERATORS = {
+    12: "++-+++---+-",
+    20: "++--++++-+-+----++-",
+    24: "+++++-+-++--++--+-+----",
+}
+
+
+def plackett_burman_coded(n_factors):
+    """
+    Coded Plackett-Burman design with the smallest run count N > n_factors.
+    Power-of-two N uses the Sylvester Hadamard matrix; 12, 20 and 24 runs use the
+    cyclic shifts of the tabulated generating row plus a row of all minus signs.
+    """
+    n_runs = next((n for n in (4, 8, 12, 16, 20, 24, 32) if n > n_factors), None)
+    if n_runs is None:
+        raise ValueError("Plackett-Burman designs are available for up to 31 factors")
+    
+    if n_runs in PLACKETT_BURMAN_GENERATORS:
+        row = np.array([1 if c == "+" else -1 for c in PLACKETT_BURMAN_GENERATORS[n_runs]], dtype=np.int8)
+        shifts = (np.arange(n_runs - 1)[None, :] - np.arange(n_runs - 1)[:, None]) % (n_runs - 1)
+        matrix = np.vstack([row[shifts], -np.ones((1, n_runs - 1), dtype=np.int8)])
+    else:
+        hadamard = np.ones((1, 1), dtype=np.int8)
+        while len(hadamard) < n_runs:
+            hadamard = np.block([[hadamard, hadamard], [hadamard, -hadamard]])
+        matrix = hadamard[:, 1:]
+    return matrix[:, :n_factors].astype(np.int8)
+
+
+# Conference matrix order -> prime power q of its Paley construction (order q + 1)
+PALEY_CONFERENCE_ORDERS = {4: 3, 6: 5, 8: 7, 10: 9, 12: 11, 14: 13, 18: 17}
+
+
+def conference_matrix(order):
+    """
+    Conference matrix C (zero diagonal, +-1 elsewhere, C'C = (order - 1) I).
+
+    Paley construction: the core is the quadratic character of y - x over GF(q),
+    bordered by a row of ones and a column of ones (q = 1 mod 4, symmetric C) or
+    minus ones (q = 3 mod 4, skew C). GF(9) is GF(3)[i] with i^2 = -1. Order 16
+    doubles the skew matrix S of order 8 as [[S, S + I], [S - I, -S]].
+    """
+    if order == 16:
+        skew, identity = conference_matrix(8), np.eye(8, dtype=np.int8)
+        return np.block([[skew, skew + identity], [skew - identity, -skew]]).astype(np.int8)
+    if order not in PALEY_CONFERENCE_ORDERS:
+        raise ValueError(f"No conference matrix of order {order} in the catalog")
+    
+    q = PALEY_CONFERENCE_ORDERS[order]
+    if q == 9:
+        a, b = np.divmod(np.arange(9), 3)
+        squares = ((a * a - b * b) % 3) * 3 + (2 * a * b) % 3
+        difference = ((a[None, :] - a[:, None]) % 3) * 3 + (b[None, :] - b[:, None]) % 3
+    else:
+        x = np.arange(q)
+        squares = (x * x) % q
+        difference = (x[None, :] - x[:, None]) % q
+    is_residue = np.zeros(q, dtype=bool)
+    is_residue[squares[1:]] = True
+    
+    matrix = np.zeros((order, order), dtype=np.int8)
+    matrix[0, 1:] = 1
+    matrix[1:, 0] = 1 if q % 4 == 1 else -1
+    matrix[1:, 1:] = np.where(difference == 0, 0, np.where(is_residue[difference], 1, -1))
+    return matrix
+
+
+def definitive_screening_coded(n_factors):
+    """
+    Coded definitive screening design (Jones & Nachtsheim): a conference matrix of
+    order k (k + 1 for odd k, dropping its last column), its fold-over and one
+    center run. Main effects are orthogonal to each other and to all two-factor
+    interactions and quadratic effects.
+    """
+    core = conference_matrix(n_factors + n_factors % 2)[:, :n_factors]
+    return np.vstack([core, -core, np.zeros((1, n_factors), dtype=np.int8)]).astype(np.int8)
+
+
+# Column generators of the 3-level linear arrays over GF(3) in Taguchi's column order
+# (coefficients of the base columns A, B, C; "12" = AB^2). L81 extends L27 with base D.
+TAGUCHI_L27_COLUMNS = ["100", "010", "110", "120", "001", "101", "102", "011", "111", "122", "012", "121", "112"]
+TAGUCHI_GF3_COLUMNS = {
+    "L9": ["10", "01", "11", "12"],
+    "L27": TAGUCHI_L27_COLUMNS,
+    "L81": [c + "0" for c in TAGUCHI_L27_COLUMNS] + ["0001"] + [c + d for c in TAGUCHI_L27_COLUMNS for d in "12"],
+}
+
+# Normalized difference schemes D(r, r, 3): the differences of any two columns hit 0, 1, 2 equally often
+DIFFERENCE_SCHEMES = {
+    6: ["000000", "002112", "021120", "012021", "020211", "011202"],
+    12: ["000000000000", "022100202111", "011202012021", "020002111212", "002112021201", "001220211102",
+         "021211102200", "021121020012", "012120110220", "000021122121", "010212220110", "012011201022"],
+}
+
+
+def _linear_array_generators(name):
+    """GF(p) coefficient vectors of the columns of a linear (regular fractional factorial) array."""
+    n_runs, levels = TAGUCHI_ARRAYS[name]
+    if levels[0] == 2:
+        n_base = int(np.log2(n_runs))
+        return 2, np.array([[(j >> i) & 1 for i in range(n_base)] for j in range(1, n_runs)])
+    return 3, np.array([[int(c) for c in column] for column in TAGUCHI_GF3_COLUMNS[name]])
+
+
+def _difference_scheme(order):
+    """D(order, order, 3); D(18, 18, 3) is the Kronecker sum of D(6, 6, 3) and the GF(3) multiplication table."""
+    if order == 18:
+        d3 = np.outer(np.arange(3), np.arange(3)) % 3
+        return (np.asarray(_difference_scheme(6))[:, None, :, None] + d3[None, :, None, :]).reshape(18, 18) % 3
+    return np.array([[int(c) for c in row] for row in DIFFERENCE_SCHEMES[order]])
+
+
+def taguchi_array(name):
+    """
+    Coded Taguchi orthogonal array (-1/+1 for 2-level, -1/0/+1 for 3-level columns).
+
+    Linear arrays are evaluated from their GF(p) column generators on the base
+    digits of the run index (first base column changes slowest). L12 is the
+    12-run Plackett-Burman design. L18, L36 and L54 stack D + g over g in GF(3)
+    for a difference scheme D(r, r, 3) and replace the r-level run index by an
+    orthogonal array in r runs (2 x 3 factorial, L12, L18), which keeps strength 2.
+    """
+    n_runs, levels = TAGUCHI_ARRAYS[name]
+    if name == "L12":
+        return plackett_burman_coded(11)
+    if name in ("L18", "L36", "L54"):
+        order = n_runs // 3
+        if order == 6:
+            row_array = np.column_stack([2 * (np.arange(6) // 3) - 1, np.arange(6) % 3 - 1])
+        else:
+            row_array = taguchi_array("L12" if order == 12 else "L18")
+        shifted = (_difference_scheme(order)[:, None, :] + np.arange(3)[None, :, None]) % 3 - 1
+        return np.hstack([np.repeat(row_array, 3, axis=0), shifted.reshape(n_runs, order)]).astype(np.int8)
+    
+    p, generators = _linear_array_generators(name)
+    n_base = generators.shape[1]
+    digits = (np.arange(n_runs)[:, None] // p ** np.arange(n_base - 1, -1, -1)) % p
+    array = (digits @ generators.T) % p
+    return (2 * array // (p - 1) - 1).astype(np.int8)
+
+
+def oa_interaction_columns(name, column_a, column_b):
+    """
+    Columns (1-based, Taguchi numbering) that carry the interaction of two columns
+    of a linear array: one column for 2-level arrays, two for 3-level arrays.
+    L12, L18, L36 and L54 spread interactions over many columns and have none.
+    """
+    if name in ("L12", "L18", "L36", "L54"):
+        raise ValueError(f"{name} spreads interactions over all columns; use a linear array (L4, L8, L9, L16, L27, L81)")
+    p, generators = _linear_array_generators(name)
+    lookup = {tuple(g): i + 1 for i, g in enumerate(generators)}
+    
+    def normalized(vector):
+        vector = vector % p
+        leading = vector[np.flatnonzero(vector)[0]]
+        return tuple((vector * pow(int(leading), -1, p)) % p)
+    
+    a, b = generators[column_a - 1], generators[column_b - 1]
+    return [lookup[normalized(a + m * b)] for m in range(1, p)]
+
+
+def assign_oa_columns(name, factor_levels, interactions=()):
+    """
+    Assign factors (name -> 2 or 3 levels) to array columns so that no factor shares
+    a column with another factor or with a requested interaction (pairs of factors).
+    Factors are placed in order by depth-first search, trying matching columns
+    first; a 2-level factor may use a 3-level column with a dummy level.
+    Returns {factor: column} and {pair: interaction columns}, both 1-based.
+    """
+    _, levels = TAGUCHI_ARRAYS[name]
+    factors = list(factor_levels)
+    
+    def search(assigned, reserved):
+        if len(assigned) == len(factors):
+            return assigned, reserved
+        factor = factors[len(assigned)]
+        need = factor_levels[factor]
+        options = [c for c in range(1, len(levels) + 1) if levels[c - 1] == need] \
+            + ([c for c in range(1, len(levels) + 1) if levels[c - 1] == 3] if need == 2 else [])
+        used = set(assigned.values()) | {c for cols in reserved.values() for c in cols}
+        for column in options:
+            if column in used:
+                continue
+            trial, new_reserved = {**assigned, factor: column}, dict(reserved)
+            clash = False
+            for pair in interactions:
+                if factor in pair and all(f in trial for f in pair):
+                    columns = oa_interaction_columns(name, trial[pair[0]], trial[pair[1]])
+                    taken = set(trial.values()) | {c for cols in new_reserved.values() for c in cols}
+                    if taken & set(columns):
+                        clash = True
+                        break
+                    new_reserved[pair] = columns
+            if not clash:
+                result = search(trial, new_reserved)
+                if result is not None:
+                    return result
+        return None
+    
+    result = search({}, {})
+    if result is None:
+        raise ValueError(f"{name} has no column assignment for these factors and interactions; choose a larger array")
+    return result
+
+
+def _ccd_skeleton(n_factors, fractional=False):
+    """Factorial core followed by unit axial points; the axial distance is applied at decode time."""
+    core = fractional_factorial_coded(n_factors) if fractional else full_factorial_coded(n_factors)
+    axial = np.kron(np.eye(n_factors, dtype=np.int8), np.array([[-1], [1]], dtype=np.int8))
+    return np.vstack([core, axial]).astype(np.int8)
+
+
+# Builders for the coded design catalog, keyed by design kind: (builder, supported factor counts)
+CODED_DESIGN_BUILDERS = {
+    "2-level factorial": (full_factorial_coded, range(2, 16)),
+    "fractional factorial": (fractional_factorial_coded, range(2, 16)),
+    "plackett-burman": (plackett_burman_coded, range(2, 16)),
+    "definitive screening": (definitive_screening_coded, range(3, 19)),
+    **{f"taguchi {name}": (lambda k, name=name: taguchi_array(name)[:, :k], range(1, len(levels) + 1))
+       for name, (_, levels) in TAGUCHI_ARRAYS.items()},
+    "box-behnken": (lambda k: box_behnken_coded(k, n_center=0), range(3, 11)),
+    "ccd": (_ccd_skeleton, range(2, 16)),
+    # Resolution V cores only: the 11-15 factor fractions are resolution IV and would alias two-factor interactions
+    "ccd fractional": (lambda k: _ccd_skeleton(k, fractional=True), range(5, 11)),
+}
+
+
+@st.cache_resource(show_spinner=False)
+def coded_design(kind, n_factors):
+    """
+    Coded (-1/0/+1) design from the catalog as a read-only int8 array.
+
+    Coded structures do not depend on the factor ranges, so each one is built once
+    per process at first use and shared across reruns and sessions; only the
+    O(n*k) affine decode runs when ranges change.
+    """
+    builder, supported = CODED_DESIGN_BUILDERS[kind]
+    if n_factors not in supported:
+        raise ValueError(f"{kind.capitalize()} designs are catalogued for {supported.start}-{supported.stop - 1} factors")
+    coded = np.ascontiguousarray(builder(n_factors), dtype=np.int8)
+    coded.flags.writeable = False
+    return coded
+
+
+def simplex_lattice_points(n_components, degree):
+    """
+    {q, m} simplex-lattice: every composition with proportions in {0, 1/m, ..., 1}.
+    Points are enumerated directly as integer compositions of m into q parts
+    (stars and bars), so the work is linear in the number of lattice points.
+    """
+    n_slots = degree + n_components - 1
+    bars = np.array(list(itertools.combinations(range(n_slots), n_components - 1)), dtype=np.int64).reshape(-1, n_components - 1)
+    edges = np.hstack([
+        np.full((len(bars), 1), -1),
+        bars,
+        np.full((len(bars), 1), n_slots)
+    ])
+    return (np.diff(edges, axis=1) - 1) / degree
+
+
+def simplex_centroid_points(n_components):
+    """Simplex-centroid design: the centroid of every non-empty subset of components (2^q - 1 points)."""
+    subsets = (np.arange(1, 2 ** n_components)[:, None] >> np.arange(n_components)) & 1
+    subsets = subsets[np.argsort(subsets.sum(axis=1), kind="stable")]
+    return subsets / subsets.sum(axis=1, keepdims=True)
+
+
+def pseudo_to_actual(pseudo_points, lower, total=100.0):
+    """Transform L-pseudo-component proportions back to actual amounts: x = L + (total - sum(L)) * z."""
+    lower = np.asarray(lower, dtype=float)
+    remaining = total - lower.sum()
+    if remaining <= 0:
+        raise ValueError(f"Component lower bounds sum to {lower.sum():.1f}%, leaving no room for a mixture")
+    return lower + remaining * np.asarray(pseudo_points, dtype=float)
+
+
+def pseudo_to_fraction(actual_points, lower, total=100.0):
+    """Inverse of pseudo_to_actual: z = (x - L) / (total - sum(L))."""
+    lower = np.asarray(lower, dtype=float)
+    return (np.asarray(actual_points, dtype=float) - lower) / (total - lower.sum())
+
+
+def generate_mixture_design(ranges_dict, mixture_type="Simplex Lattice", degree=2, min_helper_pct=0.5):
+    """
+    Generate a {q, m} simplex-lattice or simplex-centroid design for the lipid mixture.
+
+    Points are built in L-pseudo-components, using the lower range limits of the
+    lipids and min_helper_pct for the helper lipid, so every composition sums to
+    100% and respects the minimum fractions. Lattice points that exceed an upper
+    range limit are dropped. When the remaining points cannot fit the Scheffé model
+    the design is meant for (degree m for a lattice, capped at the page's quadratic
+    mixture model; quadratic for the centroid design), the bounds are too narrow for
+    a simplex design and an extreme-vertices design of the constrained region is
+    returned instead. Non-mixture factors are held at the center of their range.
+    """
+    missing = [c for c in COMPOSITION_FACTORS if c not in ranges_dict]
+    if missing:
+        raise ValueError(f"Mixture designs need ranges for {', '.join(COMPOSITION_FACTORS)} (missing: {', '.join(missing)})")
+    
+    bounds = {**ranges_dict, "Helper_%": (min_helper_pct, 100.0)}
+    lower = np.array([bounds[c][0] for c in MIXTURE_COMPONENTS])
+    upper = np.array([bounds[c][1] for c in MIXTURE_COMPONENTS])
+    
+    q = len(MIXTURE_COMPONENTS)
+    if mixture_type == "Simplex Centroid":
+        pseudo = simplex_centroid_points(q)
+    else:
+        pseudo = simplex_lattice_points(q, degree)
+    points = pseudo_to_actual(pseudo, lower)
+    
+    within_upper = (points <= upper + 1e-9).all(axis=1)
+    n_kept = int(within_upper.sum())
+    
+    # Rank of the implied Scheffé model (linear blending terms, plus binary products if quadratic) on the kept points
+    model_degree = 2 if mixture_type == "Simplex Centroid" else min(degree, 2)
+    kept = pseudo[within_upper]
+    terms = [kept[:, i] for i in range(q)]
+    if model_degree == 2:
+        terms += [kept[:, i] * kept[:, j] for i, j in itertools.combinations(range(q), 2)]
+    if np.linalg.matrix_rank(np.column_stack(terms)) < len(terms):
+        design_df = generate_extreme_vertices_design(ranges_dict, min_helper_pct=min_helper_pct)
+        design_df.attrs["warnings"] = [
+            f"⚠️ **Mixture Bounds**: only {n_kept} of {len(points)} {mixture_type.lower()} points fit within the upper factor limits, "
+            f"too few for the {len(terms)}-term Scheffé {'quadratic' if model_degree == 2 else 'linear'} model. "
+            f"Using a **Mixture Design (Extreme Vertices)** of the constrained region ({len(design_df)} points) instead."
+        ]
+        return design_df
+    
+    warnings = []
+    if n_kept < len(points):
+        warnings.append(
+            f"⚠️ **Mixture Bounds**: {len(points) - n_kept} of {len(points)} {mixture_type.lower()} points exceed the upper "
+            f"factor limits and were dropped. Use **Mixture Design (Extreme Vertices)** when upper bounds are active."
+        )
+    
+    design_df = pd.DataFrame(points[within_upper], columns=MIXTURE_COMPONENTS)[COMPOSITION_FACTORS]
+    for factor, (min_val, max_val) in ranges_dict.items():
+        if factor not in COMPOSITION_FACTORS:
+            design_df[factor] = (min_val + max_val) / 2
+    
+    design_df = design_df[list(ranges_dict.keys())]
+    design_df.attrs["warnings"] = warnings
+    return design_df
+
+
+EXTREME_VERTICES_POINT_TYPES = ["Vertices", "Edge centroids", "Face centroids", "Overall centroid"]
+
+
+def extreme_vertices(lower, upper, total=100.0, tol=1e-9):
+    """
+    Vertices of the constrained simplex {sum(x) = total, lower <= x <= upper}
+    (McLean & Anderson). For each component in turn, every other component is
+    set to one of its bounds and the remaining one takes up the balance; the
+    combination is a vertex when that balance lies within its own bounds.
+
+    Returns the vertex array and a boolean matrix of active bounds
+    (first q columns: at lower bound, last q columns: at upper bound).
+    """
+    lower = np.asarray(lower, dtype=float)
+    upper = np.asarray(upper, dtype=float)
+    q = len(lower)
+    corners = np.array(list(itertools.product([0, 1], repeat=q - 1)), dtype=bool)
+    
+    candidates = []
+    for free in range(q):
+        others = [i for i in range(q) if i != free]
+        points = np.empty((len(corners), q))
+        points[:, others] = np.where(corners, upper[others], lower[others])
+        points[:, free] = total - points[:, others].sum(axis=1)
+        in_bounds = (points[:, free] >= lower[free] - tol) & (points[:, free] <= upper[free] + tol)
+        candidates.append(points[in_bounds])
+    
+    vertices = np.unique(np.round(np.vstack(candidates), 9), axis=0)
+    active = np.hstack([
+        np.abs(vertices - lower) <= tol * max(total, 1.0),
+        np.abs(vertices - upper) <= tol * max(total, 1.0)
+    ])
+    return vertices, active
+
+
+def extreme_vertices_design_points(lower, upper, total=100.0, point_types=EXTREME_VERTICES_POINT_TYPES):
+    """
+    Extreme-vertices mixture design: vertices, edge centroids (vertex pairs sharing
+    q-2 active bounds), 2-D face centroids (vertex sets sharing q-3 active bounds)
+    and the overall centroid of the constrained region.
+    """
+    vertices, active = extreme_vertices(lower, upper, total)
+    if len(vertices) == 0:
+        raise ValueError("The component bounds do not admit any mixture summing to 100%")
+    
+    q = vertices.shape[1]
+    blocks = []
+    if "Vertices" in point_types:
+        blocks.append(vertices)
+    
+    if "Edge centroids" in point_types and len(vertices) > 1:
+        shared = active.astype(np.int64) @ active.T.astype(np.int64)
+        i, j = np.nonzero(np.triu(shared >= q - 2, k=1))
+        blocks.append((vertices[i] + vertices[j]) / 2)
+    
+    if "Face centroids" in point_types and q >= 4:
+        for bounds_subset in itertools.combinations(range(2 * q), q - 3):
+            members = active[:, list(bounds_subset)].all(axis=1)
+            if members.sum() >= 3:
+                blocks.append(vertices[members].mean(axis=0, keepdims=True))
+    
+    if "Overall centroid" in point_types:
+        blocks.append(vertices.mean(axis=0, keepdims=True))
+    
+    if not blocks:
+        raise ValueError("Select at least one point type for the extreme-vertices design")
+    
+    points = np.vstack(blocks)
+    _, first = np.unique(np.round(points, 6), axis=0, return_index=True)
+    return points[np.sort(first)]
+
+
+def generate_extreme_vertices_design(ranges_dict, min_helper_pct=0.5, max_helper_pct=100.0,
+                                     point_types=EXTREME_VERTICES_POINT_TYPES):
+    """
+    Generate an extreme-vertices mixture design for the four-lipid simplex.
+
+    Ionizable, Cholesterol and PEG bounds come from the factor ranges and Helper is
+    bounded by [min_helper_pct, max_helper_pct], so every point sums to 100% and is
+    feasible by construction. Non-mixture factors (e.g. Ion_DNA_Ratio) are held at
+    the center of their range.
+    """
+    missing = [c for c in COMPOSITION_FACTORS if c not in ranges_dict]
+    if missing:
+        raise ValueError(f"Mixture designs need ranges for {', '.join(COMPOSITION_FACTORS)} (missing: {', '.join(missing)})")
+    
+    bounds = {**ranges_dict, "Helper_%": (min_helper_pct, max_helper_pct)}
+    lower = np.array([bounds[c][0] for c in MIXTURE_COMPONENTS])
+    upper = np.array([bounds[c][1] for c in MIXTURE_COMPONENTS])
+    points = extreme_vertices_design_points(lower, upper, 100.0, point_types)
+    
+    design_df = pd.DataFrame(points, columns=MIXTURE_COMPONENTS)[COMPOSITION_FACTORS]
+    for factor, (min_val, max_val) in ranges_dict.items():
+        if factor not in COMPOSITION_FACTORS:
+            design_df[factor] = (min_val + max_val) / 2
+    
+    return design_df[list(ranges_dict.keys())]
+
+
+def nearest_neighbor_distances(points, chunk_size=None):
+    """
+    Nearest-neighbour distance and index for every row of `points`.
+    Pairwise distances are evaluated in row chunks so memory stays O(chunk * n).
+    """
+    points = np.asarray(points, dtype=float)
+    n = len(points)
+    if chunk_size is None:
+        chunk_size = max(1, 2_000_000 // max(n, 1))
+    
+    sq_norms = (points ** 2).sum(axis=1)
+    nn_dist = np.empty(n)
+    nn_idx = np.empty(n, dtype=np.int64)
+    
+    for start in range(0, n, chunk_size):
+        stop = min(start + chunk_size, n)
+        d2 = sq_norms[start:stop, None] + sq_norms[None, :] - 2.0 * points[start:stop] @ points.T
+        d2[np.arange(stop - start), np.arange(start, stop)] = np.inf
+        nn_idx[start:stop] = d2.argmin(axis=1)
+        nn_dist[start:stop] = np.sqrt(np.maximum(d2[np.arange(stop - start), nn_idx[start:stop]], 0.0))
+    
+    return nn_dist, nn_idx
+
+
+def _distances_to_all(points, sq_norms, rows):
+    """Distances from points[rows] to every point, with self-distances set to inf."""
+    d2 = sq_norms[rows, None] + sq_norms[None, :] - 2.0 * points[rows] @ points.T
+    d = np.sqrt(np.maximum(d2, 0.0))
+    d[np.arange(len(rows)), rows] = np.inf
+    return d
+
+
+def maximin_swap_optimize(unit_points, is_feasible, n_iter=2000, max_stall=500, rng=None):
+    """
+    Improve the minimum pairwise distance of a Latin hypercube by swapping one
+    coordinate between the critical (closest) point and a random partner.
+
+    Swapping within a column keeps every column's set of strata, so the Latin
+    property is preserved. `is_feasible` maps a (m, k) unit array to a boolean
+    mask; swaps that would leave the feasible region are rejected. Only the
+    distance rows of the changed points are recomputed in each iteration.
+    """
+    rng = np.random.default_rng(rng)
+    points = np.array(unit_points, dtype=float)
+    n, k = points.shape
+    if n < 3:
+        return points
+    
+    nn_dist, nn_idx = nearest_neighbor_distances(points)
+    sq_norms = (points ** 2).sum(axis=1)
+    stall = 0
+    
+    for _ in range(n_iter):
+        a = int(nn_dist.argmin())
+        b = int(rng.integers(n - 1))
+        b += b >= a
+        j = int(rng.integers(k))
+        
+        pair = np.array([a, b])
+        proposal = points[pair].copy()
+        proposal[[0, 1], j] = proposal[[1, 0], j]
+        if not is_feasible(proposal).all():
+            stall += 1
+            if stall >= max_stall:
+                break
+            continue
+        
+        old_points = points[pair].copy()
+        points[pair] = proposal
+        sq_norms[pair] = (proposal ** 2).sum(axis=1)
+        d_rows = _distances_to_all(points, sq_norms, pair)
+        new_local = d_rows.min(axis=1)
+        
+        if new_local.min() <= nn_dist[pair].min():
+            points[pair] = old_points
+            sq_norms[pair] = (old_points ** 2).sum(axis=1)
+            stall += 1
+            if stall >= max_stall:
+                break
+            continue
+        
+        stall = 0
+        nn_dist[pair] = new_local
+        nn_idx[pair] = d_rows.argmin(axis=1)
+        
+        # Other points may now be closer to a or b ...
+        closer = d_rows.min(axis=0) < nn_dist
+        closer[pair] = False
+        nn_idx[closer] = pair[d_rows[:, closer].argmin(axis=0)]
+        nn_dist[closer] = d_rows[:, closer].min(axis=0)
+        
+        # ... or may have lost a or b as their nearest neighbour
+        stale_mask = ((nn_idx == a) | (nn_idx == b)) & ~closer
+        stale_mask[pair] = False
+        stale = np.flatnonzero(stale_mask)
+        if len(stale) > 0:
+            d_stale = _distances_to_all(points, sq_norms, stale)
+            nn_idx[stale] = d_stale.argmin(axis=1)
+            nn_dist[stale] = d_stale.min(axis=1)
+    
+    return points
+
+
+def latin_hypercube_unit(n_points, n_factors, rng):
+    """Random Latin hypercube on [0, 1)^k: one point per stratum in every column."""
+    strata = rng.permuted(np.tile(np.arange(n_points), (n_factors, 1)), axis=1).T
+    return (strata + rng.random((n_points, n_factors))) / n_points
+
+
+def generate_latin_hypercube(ranges_dict, n_runs=96, min_helper_pct=0.5, n_iter=None, seed=42):
+    """
+    Generate a constraint-aware maximin Latin hypercube with exactly n_runs points.
+
+    The hypercube is drawn with enough strata that its feasible rows
+    (Ionizable + Cholesterol + PEG <= 100 - min_helper_pct) cover n_runs, so every
+    returned point lies inside the feasible region and no column stratum is used
+    twice. The spread is then improved with feasibility-preserving maximin swaps.
+    """
+    rng = np.random.default_rng(seed)
+    factor_names = list(ranges_dict.keys())
+    n_factors = len(factor_names)
+    
+    bounds = np.array([ranges_dict[f] for f in factor_names], dtype=float)
+    low, span = bounds[:, 0], bounds[:, 1] - bounds[:, 0]
+    
+    def is_feasible(unit_points):
+        return composition_feasible_mask(low + unit_points * span, factor_names, min_helper_pct)
+    
+    feasible_fraction = is_feasible(rng.random((4096, n_factors))).mean()
+    if feasible_fraction == 0:
+        raise ValueError("No feasible formulations inside the selected ranges (Ionizable + Cholesterol + PEG always exceeds the helper limit)")
+    
+    n_strata = int(np.ceil(n_runs / feasible_fraction * 1.05))
+    for _ in range(20):
+        candidates = latin_hypercube_unit(n_strata, n_factors, rng)
+        feasible = np.flatnonzero(is_feasible(candidates))
+        if len(feasible) >= n_runs:
+            break
+        n_strata = int(np.ceil(n_strata * n_runs / max(len(feasible), 1) * 1.05))
+    else:
+        raise ValueError("Could not place the requested number of feasible runs; widen the factor ranges")
+    
+    unit_points = candidates[rng.choice(feasible, size=n_runs, replace=False)]
+    
+    if n_iter is None:
+        n_iter = min(50 * n_runs, 5000)
+    unit_points = maximin_swap_optimize(unit_points, is_feasible, n_iter=n_iter, rng=rng)
+    
+    return decode_coded_design(2 * unit_points - 1, ranges_dict)
+
+
+def simplex_uniform_pseudo(n_points, lower, upper, total=100.0, rng=None, max_draws=5_000_000):
+    """
+    Uniform points of the constrained simplex {lower <= x <= upper, sum(x) = total}
+    as L-pseudo-components. Flat Dirichlet draws (normalized exponentials) satisfy
+    every lower bound by construction, so only the upper bounds are enforced by
+    rejection; batch sizes follow the running acceptance rate.
+    """
+    rng = np.random.default_rng(rng)
+    lower, upper = np.asarray(lower, dtype=float), np.asarray(upper, dtype=float)
+    remaining = total - lower.sum()
+    if remaining <= 0:
+        raise ValueError(f"Component lower bounds sum to {lower.sum():.1f}%, leaving no room for a mixture")
+    cap = (upper - lower) / remaining
+    
+    accepted, n_accepted, n_drawn, batch = [], 0, 0, max(n_points, 1024)
+    while n_accepted < n_points:
+        if n_drawn >= max_draws:
+            raise ValueError("The upper bounds leave too small a part of the simplex to sample; widen them")
+        draws = rng.exponential(size=(batch, len(lower)))
+        pseudo = draws / draws.sum(axis=1, keepdims=True)
+        pseudo = pseudo[(pseudo <= cap).all(axis=1)]
+        accepted.append(pseudo)
+        n_accepted += len(pseudo)
+        n_drawn += batch
+        rate = max(n_accepted / n_drawn, 1e-3)
+        batch = int(min(max(1.2 * (n_points - n_accepted) / rate, 1024), 1_000_000))
+    return np.vstack(accepted)[:n_points]
+
+
+def maximin_subset(pool, n_points, n_iter=None):
+    """
+    Pick n_points rows of pool with a large minimum pairwise distance. Starting
+    from the first n_points rows, a point of the closest pair is replaced by the
+    pool point farthest from the rest of the design while that raises the minimum
+    distance. The pool-to-design distance matrix is kept, so each swap refreshes
+    one column. Returns the selected row indices.
+    """
+    pool = np.asarray(pool, dtype=float)
+    selected = np.arange(n_points)
+    sq_norms = (pool ** 2).sum(axis=1)
+    
+    def distances_to(rows):
+        return np.sqrt(np.maximum(sq_norms[:, None] + sq_norms[None, rows] - 2.0 * pool @ pool[rows].T, 0.0))
+    
+    dist = distances_to(selected)  # (pool, design)
+    for _ in range(n_iter or 20 * n_points):
+        internal = dist[selected].copy()
+        np.fill_diagonal(internal, np.inf)
+        nearest = internal.min(axis=1)
+        critical = nearest.min()
+        a = int(nearest.argmin())
+        
+        improved = False
+        for position in (a, int(internal[a].argmin())):
+            others = np.delete(np.arange(n_points), position)
+            score = dist[:, others].min(axis=1)
+            candidate = int(score.argmax())
+            rest = np.delete(np.delete(internal, position, axis=0), position, axis=1).min()
+            if min(score[candidate], rest) > critical + 1e-12:
+                selected[position] = candidate
+                dist[:, position] = distances_to([candidate])[:, 0]
+                improved = True
+                break
+        if not improved:
+            break
+    return selected
+
+
+def generate_simplex_uniform_design(ranges_dict, n_runs=384, min_helper_pct=0.5, max_helper_pct=100.0,
+                                    pool_factor=4, seed=42, volume_params=None):
+    """
+    Generate a space-filling composition library inside the four-lipid simplex.
+
+    A pool of pool_factor x n_runs uniform simplex points (simplex_uniform_pseudo)
+    is crossed with uniform draws of the non-mixture factors, cut to pipetting-
+    feasible points when volume_params is given, and a maximin subset of exactly
+    n_runs points is kept. Distances use pseudo-components and unit-scaled ranges.
+    """
+    missing = [c for c in COMPOSITION_FACTORS if c not in ranges_dict]
+    if missing:
+        raise ValueError(f"Mixture designs need ranges for {', '.join(COMPOSITION_FACTORS)} (missing: {', '.join(missing)})")
+    
+    rng = np.random.default_rng(seed)
+    bounds = {**ranges_dict, "Helper_%": (min_helper_pct, max_helper_pct)}
+    lower = np.array([bounds[c][0] for c in MIXTURE_COMPONENTS])
+    upper = np.array([bounds[c][1] for c in MIXTURE_COMPONENTS])
+    process = [f for f in ranges_dict if f not in MIXTURE_COMPONENTS]
+    process_bounds = np.array([ranges_dict[f] for f in process], dtype=float).reshape(-1, 2)
+    
+    n_pool = pool_factor * n_runs
+    pseudo = simplex_uniform_pseudo(n_pool, lower, upper, rng=rng)
+    unit_process = rng.random((n_pool, len(process)))
+    design_df = pd.DataFrame(pseudo_to_actual(pseudo, lower), columns=MIXTURE_COMPONENTS)[COMPOSITION_FACTORS]
+    if process:
+        design_df[process] = process_bounds[:, 0] + unit_process * (process_bounds[:, 1] - process_bounds[:, 0])
+    design_df = design_df[list(ranges_dict.keys())]
+    
+    keep = np.ones(n_pool, dtype=bool)
+    if volume_params is not None:
+        keep = volume_feasible_mask(design_df.to_numpy(dtype=float), list(ranges_dict.keys()), volume_params)
+    if keep.sum() < n_runs:
+        raise ValueError(f"Only {int(keep.sum())} of {n_pool} sampled formulations are pipetting-feasible; reduce the run count or the Ion:DNA range")
+    
+    # Pseudo-components span [0, 1] like the unit-scaled process factors
+    metric = np.hstack([pseudo, unit_process])[keep]
+    selected = maximin_subset(metric, n_runs)
+    return design_df[keep].iloc[selected].reset_index(drop=True)
+
+
+# Sobol direction-number parameters for dimensions 2-16 from Joe & Kuo (2008),
+# new-joe-kuo-6.21201: (degree s, polynomial coefficients a, initial m_1..m_s).
+# Dimension 1 is the van der Corput sequence in base 2.
+SOBOL_DIRECTION_PARAMS = [
+    (1, 0, [1]),
+    (2, 1, [1, 3]),
+    (3, 1, [1, 3, 1]),
+    (3, 2, [1, 1, 1]),
+    (4, 1, [1, 1, 3, 3]),
+    (4, 4, [1, 3, 5, 13]),
+    (5, 2, [1, 1, 5, 5, 17]),
+    (5, 4, [1, 1, 5, 5, 5]),
+    (5, 7, [1, 1, 7, 11, 19]),
+    (5, 11, [1, 1, 5, 1, 1]),
+    (5, 13, [1, 1, 1, 3, 11]),
+    (5, 14, [1, 3, 5, 5, 31]),
+    (6, 1, [1, 3, 3, 9, 7, 49]),
+    (6, 13, [1, 1, 1, 15, 21, 21]),
+    (6, 16, [1, 3, 1, 13, 27, 49]),
+]
+SOBOL_BITS = 32
+
+HALTON_PRIMES = [2, 3, 5, 7, 11, 13, 17, 19, 23, 29, 31, 37, 41, 43, 47, 53]
+
+
+def sobol_direction_numbers(n_dims):
+    """Direction numbers V[d, j] (32-bit integers) for the first n_dims Sobol dimensions."""
+    if n_dims > len(SOBOL_DIRECTION_PARAMS) + 1:
+        raise ValueError(f"Sobol sequences are available for up to {len(SOBOL_DIRECTION_PARAMS) + 1} factors")
+    
+    shifts = SOBOL_BITS - 1 - np.arange(SOBOL_BITS)
+    directions = np.zeros((n_dims, SOBOL_BITS), dtype=np.uint64)
+    directions[0] = np.left_shift(np.uint64(1), shifts.astype(np.uint64))
+    
+    for d in range(1, n_dims):
+        degree, coeffs, m_init = SOBOL_DIRECTION_PARAMS[d - 1]
+        m = list(m_init)
+        for i in range(degree, SOBOL_BITS):
+            value = m[i - degree] ^ (m[i - degree] << degree)
+            for k in range(1, degree):
+                if (coeffs >> (degree - 1 - k)) & 1:
+                    value ^= m[i - k] << k
+            m.append(value)
+        directions[d] = [m[i] << int(shifts[i]) for i in range(SOBOL_BITS)]
+    
+    return directions
+
+
+def _sobol_scramble_params(n_dims, scramble, seed):
+    """
+    Direction numbers and digital shift for the requested scrambling.
+    Owen-type scrambling applies a random lower-triangular binary matrix to the
+    direction numbers (linear matrix scrambling) followed by a random digital shift.
+    """
+    directions = sobol_direction_numbers(n_dims)
+    shift = np.zeros(n_dims, dtype=np.uint64)
+    if scramble == "None":
+        return directions, shift
+    
+    rng = np.random.default_rng(seed)
+    if scramble == "Owen":
+        bit_weights = np.left_shift(np.uint64(1), np.arange(SOBOL_BITS - 1, -1, -1, dtype=np.uint64))
+        for d in range(n_dims):
+            lower = np.tril(rng.integers(0, 2, size=(SOBOL_BITS, SOBOL_BITS)), k=-1) + np.eye(SOBOL_BITS, dtype=np.int64)
+            bits = ((directions[d][:, None] & bit_weights[None, :]) > 0).astype(np.int64)
+            scrambled_bits = (bits @ lower.T) % 2
+            directions[d] = (scrambled_bits.astype(np.uint64) * bit_weights[None, :]).sum(axis=1)
+    
+    shift[:] = rng.integers(0, 2 ** SOBOL_BITS, size=n_dims, dtype=np.uint64)
+    return directions, shift
+
+
+def sobol_points(n_points, n_dims, skip=0, scramble="Owen", seed=0):
+    """
+    Points skip .. skip + n_points - 1 of a (scrambled) Sobol sequence.
+    Each index is computed directly from its Gray code, so any block of the
+    sequence can be generated without producing the points before it.
+    """
+    directions, shift = _sobol_scramble_params(n_dims, scramble, seed)
+    index = np.arange(skip, skip + n_points, dtype=np.uint64)
+    gray = index ^ (index >> np.uint64(1))
+    bits = ((gray[:, None] >> np.arange(SOBOL_BITS, dtype=np.uint64)) & np.uint64(1)).astype(bool)
+    
+    # Bit j of the Gray code selects direction number j in every dimension
+    ints = np.bitwise_xor.reduce(np.where(bits[:, None, :], directions[None, :, :], np.uint64(0)), axis=2)
+    return (ints ^ shift).astype(float) / 2.0 ** SOBOL_BITS
+
+
+def halton_points(n_points, n_dims, skip=0, scramble="Owen", seed=0):
+    """
+    Points skip .. skip + n_points - 1 of a (scrambled) Halton sequence.
+    Owen-type scrambling applies an independent random digit permutation at every
+    digit position; random-shift scrambling adds a Cranley-Patterson rotation.
+    """
+    if n_dims > len(HALTON_PRIMES):
+        raise ValueError(f"Halton sequences are available for up to {len(HALTON_PRIMES)} factors")
+    
+    index = np.arange(skip, skip + n_points, dtype=np.int64)
+    points = np.zeros((n_points, n_dims))
+    
+    for d, base in enumerate(HALTON_PRIMES[:n_dims]):
+        rng = np.random.default_rng([seed, d])
+        n_digits = int(np.ceil(SOBOL_BITS * np.log(2) / np.log(base)))
+        if scramble == "Owen":
+            perms = np.argsort(rng.random((n_digits, base)), axis=1)
+        remaining = index.copy()
+        scale = 1.0 / base
+        for level in range(n_digits):
+            digit = remaining % base
+            if scramble == "Owen":
+                digit = perms[level][digit]
+            points[:, d] += digit * scale
+            remaining //= base
+            scale /= base
+        if scramble == "Random shift":
+            points[:, d] = (points[:, d] + rng.random()) % 1.0
+    
+    return points
+
+
+def iter_low_discrepancy_chunks(n_dims, method="Sobol", start=0, chunk_size=4096, scramble="Owen", seed=0):
+    """Yield (sequence_indices, unit_points) blocks of a low-discrepancy sequence indefinitely."""
+    point_fn = sobol_points if method == "Sobol" else halton_points
+    while True:
+        yield np.arange(start, start + chunk_size), point_fn(chunk_size, n_dims, skip=start, scramble=scramble, seed=seed)
+        start += chunk_size
+
+
+def generate_low_discrepancy_design(ranges_dict, n_runs=384, method="Sobol", skip=0, scramble="Owen",
+                                    seed=0, min_helper_pct=0.5, chunk_size=4096):
+    """
+    Generate n_runs feasible formulations from a Sobol or Halton sequence.
+
+    The sequence is streamed in chunks starting at index `skip` and each chunk
+    is mapped into the factor box; points violating the molar-sum constraint are
+    skipped. The next unused sequence index is stored in `df.attrs["next_skip"]`,
+    so a screen can be extended later without repeating points.
+    """
+    factor_names = list(ranges_dict.keys())
+    bounds = np.array([ranges_dict[f] for f in factor_names], dtype=float)
+    low, span = bounds[:, 0], bounds[:, 1] - bounds[:, 0]
+    
+    kept_values, kept_index = [], []
+    n_kept, n_scanned = 0, 0
+    for index, unit_points in iter_low_discrepancy_chunks(len(factor_names), method, skip, chunk_size, scramble, seed):
+        values = low + unit_points * span
+        feasible = composition_feasible_mask(values, factor_names, min_helper_pct)
+        kept_values.append(values[feasible])
+        kept_index.append(index[feasible])
+        n_kept += int(feasible.sum())
+        n_scanned += chunk_size
+        if n_kept >= n_runs:
+            break
+        if n_kept == 0 and n_scanned >= 16 * chunk_size:
+            raise ValueError("No feasible formulations inside the selected ranges (Ionizable + Cholesterol + PEG always exceeds the helper limit)")
+    
+    values = np.vstack(kept_values)[:n_runs]
+    index = np.concatenate(kept_index)[:n_runs]
+    
+    design_df = pd.DataFrame(values, columns=factor_names)
+    design_df.attrs["next_skip"] = int(index[-1]) + 1
+    return design_df
+
+
+DOE_MODELS = ["Linear", "Interactions", "Quadratic", "Scheffé Quadratic"]
+
+
+def full_factorial_levels_coded(n_factors, n_levels=3):
+    """
+    Coded full factorial with n_levels equally spaced levels in [-1, 1], built by
+    mixed-radix decoding of the run index (first factor changes slowest).
+    """
+    index = np.arange(n_levels ** n_factors)
+    digits = (index[:, None] // n_levels ** np.arange(n_factors - 1, -1, -1)) % n_levels
+    return 2.0 * digits / (n_levels - 1) - 1.0
+
+
+def build_model_matrix(values, factor_names, ranges_dict, model="Linear"):
+    """
+    Model matrix for a design given in physical units.
+
+    Linear, Interactions and Quadratic models use coded factors (-1..+1 over the
+    ranges) with an intercept. The Scheffé quadratic model uses the four lipid
+    proportions (Helper = 100 - the others) in L-pseudo-components, without
+    intercept, with linear and pairwise blending terms, plus any process factors
+    as coded main effects.
+    Returns the matrix and the list of term names.
+    """
+    values = np.asarray(values, dtype=float)
+    bounds = np.array([ranges_dict[f] for f in factor_names], dtype=float)
+    coded = (values - bounds.mean(axis=1)) / ((bounds[:, 1] - bounds[:, 0]) / 2)
+    k = len(factor_names)
+    
+    if model == "Scheffé Quadratic":
+        missing = [c for c in COMPOSITION_FACTORS if c not in factor_names]
+        if missing:
+            raise ValueError(f"The Scheffé model needs {', '.join(COMPOSITION_FACTORS)} as design factors")
+        comp = {c: values[:, factor_names.index(c)] for c in COMPOSITION_FACTORS}
+        comp["Helper_%"] = 100.0 - sum(comp.values())
+        lower = np.array([ranges_dict[c][0] if c in ranges_dict else 0.0 for c in MIXTURE_COMPONENTS])
+        proportions = pseudo_to_fraction(np.column_stack([comp[c] for c in MIXTURE_COMPONENTS]), lower)
+        pairs = list(itertools.combinations(range(len(MIXTURE_COMPONENTS)), 2))
+        process = [i for i, f in enumerate(factor_names) if f not in COMPOSITION_FACTORS]
+        columns = [proportions, proportions[:, [i for i, _ in pairs]] * proportions[:, [j for _, j in pairs]], coded[:, process]]
+        names = (MIXTURE_COMPONENTS
+                 + [f"{MIXTURE_COMPONENTS[i]}*{MIXTURE_COMPONENTS[j]}" for i, j in pairs]
+                 + [factor_names[i] for i in process])
+        return np.hstack(columns), names
+    
+    columns = [np.ones((len(values), 1)), coded]
+    names = ["Intercept"] + list(factor_names)
+    if model in ("Interactions", "Quadratic") and k > 1:
+        pairs = list(itertools.combinations(range(k), 2))
+        columns.append(coded[:, [i for i, _ in pairs]] * coded[:, [j for _, j in pairs]])
+        names += [f"{factor_names[i]}*{factor_names[j]}" for i, j in pairs]
+    if model == "Quadratic":
+        columns.append(coded ** 2)
+        names += [f"{f}^2" for f in factor_names]
+    return np.hstack(columns), names
+
+
+def optimal_design_candidates(ranges_dict, min_helper_pct=0.5, n_fill=2048, seed=0):
+    """
+    Feasible candidate points (physical units) for exchange algorithms: a 3-level
+    grid (2-level for many factors), Sobol fill points and, when all lipid factors
+    are studied, the extreme vertices of the molar-sum constrained region.
+    """
+    factor_names = list(ranges_dict.keys())
+    k = len(factor_names)
+    
+    if 3 ** k <= 6561:
+        grid = full_factorial_levels_coded(k, 3)
+    else:
+        grid = full_factorial_coded(min(k, 12)).astype(float)
+        if k > 12:
+            grid = np.hstack([grid, np.zeros((len(grid), k - 12))])
+    blocks = [decode_coded_design(grid, ranges_dict).to_numpy()]
+    
+    bounds = np.array([ranges_dict[f] for f in factor_names], dtype=float)
+    blocks.append(bounds[:, 0] + sobol_points(n_fill, k, scramble="Owen", seed=seed) * (bounds[:, 1] - bounds[:, 0]))
+    
+    if all(c in ranges_dict for c in COMPOSITION_FACTORS):
+        limits = {**ranges_dict, "Helper_%": (min_helper_pct, 100.0)}
+        vertices, _ = extreme_vertices([limits[c][0] for c in MIXTURE_COMPONENTS], [limits[c][1] for c in MIXTURE_COMPONENTS])
+        process = [f for f in factor_names if f not in COMPOSITION_FACTORS]
+        process_levels = decode_coded_design(full_factorial_levels_coded(len(process), 3), {f: ranges_dict[f] for f in process}) if process else pd.DataFrame(index=[0])
+        vertex_df = pd.DataFrame(vertices, columns=MIXTURE_COMPONENTS)[COMPOSITION_FACTORS]
+        crossed = vertex_df.merge(process_levels, how="cross")
+        blocks.append(crossed[factor_names].to_numpy())
+    
+    candidates = np.unique(np.round(np.vstack(blocks), 9), axis=0)
+    return candidates[composition_feasible_mask(candidates, factor_names, min_helper_pct)]
+
+
+def _sherman_morrison(m_inv, x, sign=1.0):
+    """Inverse of (M + sign * x x') given M^-1."""
+    mx = m_inv @ x
+    return m_inv - sign * np.outer(mx, mx) / (1.0 + sign * (x @ mx))
+
+
+def fedorov_exchange(candidate_matrix, n_runs, rng, fixed_matrix=None, max_iter=500, ridge=1e-8):
+    """
+    D-optimal Fedorov exchange over a candidate model matrix.
+
+    All (design row, candidate) swaps are scored at once with the determinant
+    ratio (1 + d_j)(1 - d_i) + d_ij^2; the best swap is applied and M^-1 is kept
+    current with two Sherman-Morrison rank-one updates. Rows in fixed_matrix
+    (e.g. runs already performed) stay in the information matrix but are never
+    exchanged. Returns candidate indices of the new runs and log det(M).
+    """
+    n_cand, p = candidate_matrix.shape
+    fixed_info = fixed_matrix.T @ fixed_matrix if fixed_matrix is not None else np.zeros((p, p))
+    selected = rng.choice(n_cand, size=n_runs, replace=n_runs > n_cand)
+    
+    info = fixed_info + candidate_matrix[selected].T @ candidate_matrix[selected] + ridge * np.eye(p)
+    info_inv = np.linalg.inv(info)
+    
+    for iteration in range(max_iter):
+        if iteration % 50 == 0:
+            info_inv = np.linalg.inv(info)
+        design_rows = candidate_matrix[selected]
+        cand_proj = candidate_matrix @ info_inv
+        d_cand_all = (cand_proj * candidate_matrix).sum(axis=1)
+        d_design = d_cand_all[selected]
+        d_cross = design_rows @ cand_proj.T
+        
+        ratio = (1.0 + d_cand_all[None, :]) * (1.0 - d_design[:, None]) + d_cross ** 2
+        i, j = np.unravel_index(np.argmax(ratio), ratio.shape)
+        if ratio[i, j] <= 1.0 + 1e-8:
+            break
+        
+        x_out, x_in = candidate_matrix[selected[i]], candidate_matrix[j]
+        info_inv = _sherman_morrison(_sherman_morrison(info_inv, x_in, 1.0), x_out, -1.0)
+        info += np.outer(x_in, x_in) - np.outer(x_out, x_out)
+        selected[i] = j
+    
+    sign, log_det = np.linalg.slogdet(info - ridge * np.eye(p))
+    return selected, (log_det if sign > 0 else -np.inf)
+
+
+def _best_of_starts(search_fn, n_starts, seed):
+    """Run independent random starts of search_fn(rng) in a thread pool and keep the best score."""
+    with ThreadPoolExecutor(max_workers=min(n_starts, os.cpu_count() or 1)) as pool:
+        results = list(pool.map(lambda s: search_fn(np.random.default_rng([seed, s])), range(n_starts)))
+    return max(results, key=lambda r: r[1])
+
+
+def generate_d_optimal_design(ranges_dict, n_runs=24, model="Quadratic", n_starts=8, min_helper_pct=0.5, seed=0):
+    """
+    Generate a D-optimal design with exactly n_runs runs from a feasible candidate set.
+    Independent random starts of the Fedorov exchange run in parallel and the
+    design with the largest det(X'X) is returned.
+    """
+    factor_names = list(ranges_dict.keys())
+    candidates = optimal_design_candidates(ranges_dict, min_helper_pct, seed=seed)
+    if len(candidates) == 0:
+        raise ValueError("No feasible candidate formulations inside the selected ranges")
+    
+    candidate_matrix, terms = build_model_matrix(candidates, factor_names, ranges_dict, model)
+    if n_runs < len(terms):
+        raise ValueError(f"The {model} model has {len(terms)} terms; at least {len(terms)} runs are required")
+    
+    selected, log_det = _best_of_starts(
+        lambda rng: fedorov_exchange(candidate_matrix, n_runs, rng), n_starts, seed
+    )
+    
+    design_df = pd.DataFrame(candidates[selected], columns=factor_names)
+    design_df.attrs["log_det"] = log_det
+    return design_df
+
+
+@st.cache_data(show_spinner=False)
+def region_moment_matrix(ranges_items, model, min_helper_pct=0.5, n_samples=20000, seed=0):
+    """
+    Moments matrix W = E[f(x) f(x)'] of the model over the feasible design region,
+    integrated by Monte Carlo over uniform points that satisfy the molar-sum
+    constraint. Cached per (ranges, model, helper limit).
+    """
+    ranges_dict = dict(ranges_items)
+    factor_names = list(ranges_dict.keys())
+    bounds = np.array([ranges_dict[f] for f in factor_names], dtype=float)
+    rng = np.random.default_rng(seed)
+    
+    samples = bounds[:, 0] + rng.random((n_samples, len(factor_names))) * (bounds[:, 1] - bounds[:, 0])
+    samples = samples[composition_feasible_mask(samples, factor_names, min_helper_pct)]
+    if len(samples) == 0:
+        raise ValueError("No feasible formulations inside the selected ranges")
+    
+    model_matrix, _ = build_model_matrix(samples, factor_names, ranges_dict, model)
+    return model_matrix.T @ model_matrix / len(model_matrix)
+
+
+def i_optimal_exchange(candidate_matrix, moments, selected, max_iter=500, ridge=1e-8):
+    """
+    Exchange algorithm minimizing the I-criterion trace(W M^-1).
+
+    For every (design row i, candidate j) swap the change in the criterion follows
+    from the rank-two update of M^-1 in closed form,
+        [(d_i - 1) g_j + (1 + d_j) g_i - 2 d_ij g_ij] / [(1 + d_j)(1 - d_i) + d_ij^2],
+    with d = x' M^-1 x and g = x' M^-1 W M^-1 x, so each iteration scores all
+    swaps with a few matrix products and updates the trace incrementally.
+    """
+    selected = np.array(selected, copy=True)
+    p = candidate_matrix.shape[1]
+    info = candidate_matrix[selected].T @ candidate_matrix[selected] + ridge * np.eye(p)
+    
+    for iteration in range(max_iter):
+        if iteration % 50 == 0:
+            info_inv = np.linalg.inv(info)
+            criterion = np.trace(moments @ info_inv)
+        
+        weighted = info_inv @ moments @ info_inv
+        cand_d_proj = candidate_matrix @ info_inv
+        cand_g_proj = candidate_matrix @ weighted
+        d_cand = (cand_d_proj * candidate_matrix).sum(axis=1)
+        g_cand = (cand_g_proj * candidate_matrix).sum(axis=1)
+        design_rows = candidate_matrix[selected]
+        d_cross = design_rows @ cand_d_proj.T
+        g_cross = design_rows @ cand_g_proj.T
+        d_design, g_design = d_cand[selected][:, None], g_cand[selected][:, None]
+        
+        ratio = (1.0 + d_cand[None, :]) * (1.0 - d_design) + d_cross ** 2
+        change = np.where(
+            ratio > 1e-10,
+            ((d_design - 1.0) * g_cand[None, :] + (1.0 + d_cand[None, :]) * g_design - 2.0 * d_cross * g_cross) / np.maximum(ratio, 1e-10),
+            np.inf
+        )
+        i, j = np.unravel_index(np.argmin(change), change.shape)
+        if change[i, j] >= -1e-9 * abs(criterion):
+            break
+        
+        x_out, x_in = candidate_matrix[selected[i]], candidate_matrix[j]
+        info_inv = _sherman_morrison(_sherman_morrison(info_inv, x_in, 1.0), x_out, -1.0)
+        info += np.outer(x_in, x_in) - np.outer(x_out, x_out)
+        criterion += change[i, j]
+        selected[i] = j
+    
+    return selected, np.trace(moments @ np.linalg.inv(info - ridge * np.eye(p)))
+
+
+def generate_i_optimal_design(ranges_dict, n_runs=30, model="Quadratic", n_starts=4, min_helper_pct=0.5, seed=0):
+    """
+    Generate an I-optimal design (minimum average prediction variance over the
+    feasible region). Each start is seeded with a D-optimal exchange and then
+    refined with the I-criterion exchange; starts run in parallel.
+    """
+    factor_names = list(ranges_dict.keys())
+    candidates = optimal_design_candidates(ranges_dict, min_helper_pct, seed=seed)
+    if len(candidates) == 0:
+        raise ValueError("No feasible candidate formulations inside the selected ranges")
+    
+    candidate_matrix, terms = build_model_matrix(candidates, factor_names, ranges_dict, model)
+    if n_runs < len(terms):
+        raise ValueError(f"The {model} model has {len(terms)} terms; at least {len(terms)} runs are required")
+    moments = region_moment_matrix(tuple(ranges_dict.items()), model, min_helper_pct)
+    
+    def search(rng):
+        start, _ = fedorov_exchange(candidate_matrix, n_runs, rng)
+        selected, criterion = i_optimal_exchange(candidate_matrix, moments, start)
+        return selected, -criterion
+    
+    selected, neg_criterion = _best_of_starts(search, n_starts, seed)
+    
+    design_df = pd.DataFrame(candidates[selected], columns=factor_names)
+    design_df.attrs["avg_prediction_variance"] = -neg_criterion
+    return design_df
+
+
+def generate_split_plot_design(ranges_dict, whole_plot_factors=(), whole_plot_levels=2, subplot_levels=2, whole_plot_replicates=2):
+    """
+    Generate a split-plot design: each whole plot (one batch of stocks) holds the
+    hard-to-change factors at one setting of their full factorial, replicated
+    whole_plot_replicates times, and runs the full factorial of the remaining
+    (subplot) factors inside it. The whole-plot x subplot crossing is a single
+    broadcast; the Whole_Plot column numbers the batches.
+    """
+    whole_plot_names = [f for f in ranges_dict if f in whole_plot_factors]
+    subplot_names = [f for f in ranges_dict if f not in whole_plot_factors]
+    if not whole_plot_names or not subplot_names:
+        raise ValueError("Choose at least one whole-plot factor and leave at least one subplot factor")
+    
+    whole_plots = np.tile(full_factorial_levels_coded(len(whole_plot_names), whole_plot_levels), (whole_plot_replicates, 1))
+    subplots = full_factorial_levels_coded(len(subplot_names), subplot_levels)
+    n_whole, n_sub = len(whole_plots), len(subplots)
+    coded = np.concatenate([
+        np.broadcast_to(whole_plots[:, None, :], (n_whole, n_sub, len(whole_plot_names))),
+        np.broadcast_to(subplots[None, :, :], (n_whole, n_sub, len(subplot_names)))
+    ], axis=2).reshape(n_whole * n_sub, -1)
+    
+    design_df = decode_coded_design(coded, {f: ranges_dict[f] for f in whole_plot_names + subplot_names})[list(ranges_dict)]
+    design_df["Whole_Plot"] = np.repeat(np.arange(1, n_whole + 1), n_sub)
+    return design_df
+
+
+# Generator for every design type offered on the page; options are passed as keyword arguments
+DESIGN_GENERATORS = {
+    "Full Factorial (2-Level)": generate_2level_factorial,
+    "Full Factorial (3-Level)": generate_3level_factorial,
+    "Fractional Factorial": generate_fractional_factorial,
+    "Plackett-Burman": generate_plackett_burman,
+    "Definitive Screening (DSD)": generate_definitive_screening,
+    "Taguchi Orthogonal Array": generate_taguchi_design,
+    "Box-Behnken": generate_box_behnken,
+    "Central Composite": generate_central_composite,
+    "Mixture Design": generate_mixture_design,
+    "Mixture Design (Extreme Vertices)": generate_extreme_vertices_design,
+    "Mixture Design (Uniform Simplex Sampling)": generate_simplex_uniform_design,
+    "Latin Hypercube (Maximin)": generate_latin_hypercube,
+    "Low-Discrepancy (Sobol/Halton)": generate_low_discrepancy_design,
+    "D-Optimal (Custom Run Count)": generate_d_optimal_design,
+    "I-Optimal (Prediction Variance)": generate_i_optimal_design,
+    "Split-Plot (Hard-to-Change Factors)": generate_split_plot_design,
+}
+
+
+def generate_design(design_type, ranges_dict, options=None):
+    """
+    Generate the design points (physical units) for a design type with its UI options.
+    Generators do not write to the page; messages for the user are returned in
+    design_df.attrs["warnings"] so callers on worker threads stay silent.
+    """
+    return DESIGN_GENERATORS[design_type](ranges_dict, **(options or {}))
+
+
+@st.cache_data(show_spinner=False, max_entries=32)
+def cached_design(design_type, ranges_dict, options):
+    """generate_design memoized on its inputs; shared by the statistics panel and the Generate button."""
+    return generate_design(design_type, ranges_dict, options)
+
+
+def compare_designs(ranges_dict, volume_params, model="Quadratic", design_types=None, max_workers=None):
+    """
+    Generate every design type with its default options concurrently in a thread
+    pool, drop points that fail the molar-sum or pipetting checks and score the rest
+    under one model. Max prediction variance is x'(X'X)^-1 x (in units of sigma^2)
+    maximized over feasible candidate points of the region.
+    Returns a table ranked by D-efficiency; designs that cannot fit the model come last.
+    Generator warnings are reported in the Note column.
+    """
+    factor_names = list(ranges_dict.keys())
+    design_types = list(design_types or DESIGN_GENERATORS)
+    region = optimal_design_candidates(ranges_dict)
+    region = region[volume_feasible_mask(region, factor_names, volume_params)]
+    region_matrix, terms = build_model_matrix(region, factor_names, ranges_dict, model)
+    default_options = {
+        "Full Factorial (3-Level)": {"volume_params": volume_params},
+        "Mixture Design (Uniform Simplex Sampling)": {"volume_params": volume_params},
+        "Split-Plot (Hard-to-Change Factors)": {
+            "whole_plot_factors": tuple(f for f in factor_names if f in PROCESS_FACTORS and f != "Helper_%")
+        },
+    }
+    
+    def evaluate(design_type):
+        design_df = generate_design(design_type, ranges_dict, default_options.get(design_type))
+        values = design_df[factor_names].to_numpy(dtype=float)
+        feasible = composition_feasible_mask(values, factor_names) & volume_feasible_mask(values, factor_names, volume_params)
+        return values[feasible], design_df.attrs.get("n_enumerated", len(design_df)), design_df.attrs.get("warnings", [])
+    
+    # Workers share the script context so cached catalog lookups work off the main thread
+    script_ctx = get_script_run_ctx()
+    with ThreadPoolExecutor(
+        max_workers=max_workers or min(len(design_types), os.cpu_count() or 1),
+        initializer=lambda: add_script_run_ctx(threading.current_thread(), script_ctx)
+    ) as pool:
+        futures = {design_type: pool.submit(evaluate, design_type) for design_type in design_types}
+    
+    rows = []
+    for design_type, future in futures.items():
+        row = {"Design": design_type, "Runs": np.nan, "Feasible %": np.nan, "D-Efficiency %": np.nan, "Max Pred. Variance": np.nan, "Note": ""}
+        try:
+            values, n_generated, warnings = future.result()
+        except Exception as e:
+            rows.append({**row, "Note": str(e)})
+            continue
+        row.update({"Runs": len(values), "Feasible %": 100.0 * len(values) / max(n_generated, 1),
+                    "Note": " ".join(w.replace("⚠️ ", "").replace("**", "") for w in warnings)})
+        
+        F, _ = build_model_matrix(values, factor_names, ranges_dict, model) if len(values) else (np.empty((0, len(terms))), terms)
+        if len(values) < len(terms) or np.linalg.matrix_rank(F) < len(terms):
+            rows.append({**row, "Note": f"cannot fit the {model} model ({len(terms)} terms)" + (f". {row['Note']}" if row["Note"] else "")})
+            continue
+        information = F.T @ F
+        covariance = np.linalg.inv(information)
+        row["D-Efficiency %"] = 100.0 * np.exp(np.linalg.slogdet(information)[1] / len(terms)) / len(values)
+        row["Max Pred. Variance"] = float(((region_matrix @ covariance) * region_matrix).sum(axis=1).max()) if len(region_matrix) else np.nan
+        rows.append(row)
+    
+    comparison = pd.DataFrame(rows).sort_values(["D-Efficiency %", "Max Pred. Variance"], ascending=[False, True], na_position="last")
+    comparison["Runs"] = comparison["Runs"].astype("Int64")
+    comparison.insert(0, "Rank", np.arange(1, len(comparison) + 1))
+    return comparison.reset_index(drop=True)
+
+
+def design_hash(values):
+    """Content hash of a design matrix, used as the diagnostics cache key."""
+    values = np.ascontiguousarray(np.round(values, 9))
+    return hashlib.sha1(values.tobytes() + str(values.shape).encode()).hexdigest()
+
+
+@st.cache_data(show_spinner=False, max_entries=256)
+def design_diagnostics(design_key, model, ranges_items, factor_names, _values):
+    """
+    Quality metrics of a design under a model, cached per (design hash, model).
+
+    Efficiencies are in % relative to an orthogonal design on the coded region:
+    D = |X'X|^(1/p) / n, A = p / trace(n (X'X)^-1), G = p / (n max d(x)) with d(x)
+    the scaled prediction variance evaluated at the design points.
+    """
+    ranges_dict = dict(ranges_items)
+    F, terms = build_model_matrix(_values, list(factor_names), ranges_dict, model)
+    n_runs, n_terms = F.shape
+    rank = int(np.linalg.matrix_rank(F)) if n_runs else 0
+    n_unique = len(np.unique(np.round(_values, 9), axis=0)) if n_runs else 0
+    
+    diagnostics = {
+        "model": model,
+        "n_runs": n_runs,
+        "n_terms": n_terms,
+        "rank": rank,
+        "residual_df": n_runs - rank,
+        "pure_error_df": n_runs - n_unique,
+        "lack_of_fit_df": n_unique - rank,
+    }
+    if rank < n_terms:
+        return diagnostics
+    
+    information = F.T @ F
+    covariance = np.linalg.inv(information)
+    leverage = np.einsum("ij,jk,ik->i", F, covariance, F)
+    sign, logdet = np.linalg.slogdet(information)
+    diagnostics["d_efficiency"] = 100.0 * np.exp(logdet / n_terms) / n_runs
+    diagnostics["a_efficiency"] = 100.0 * n_terms / (n_runs * np.trace(covariance))
+    diagnostics["g_efficiency"] = 100.0 * n_terms / (n_runs * leverage.max())
+    
+    column_norms = np.linalg.norm(F, axis=0)
+    diagnostics["condition_number"] = float(np.linalg.cond(F / np.where(column_norms > 0, column_norms, 1.0)))
+    
+    # Correlations and VIFs of the non-constant model terms
+    varying = F.std(axis=0) > 1e-12
+    term_names = [t for t, v in zip(terms, varying) if v]
+    if len(term_names) >= 2:
+        correlation = np.corrcoef(F[:, varying], rowvar=False)
+        try:
+            vif = np.diag(np.linalg.inv(correlation))
+        except np.linalg.LinAlgError:
+            vif = np.full(len(term_names), np.inf)
+        diagnostics["correlation"] = pd.DataFrame(correlation, index=term_names, columns=term_names)
+        diagnostics["vif"] = pd.Series(vif, index=term_names, name="VIF")
+    return diagnostics
+
+
+def render_design_diagnostics(diagnostics, num_replicates=1, num_blocks=1):
+    """Show the design diagnostics as metrics plus an expander with VIFs and the term correlation map."""
+    n_runs = diagnostics["n_runs"]
+    col_m1, col_m2 = st.columns(2)
+    with col_m1:
+        st.metric("Feasible Design Points", n_runs)
+    with col_m2:
+        st.metric("Total Runs (incl. replicates & blocks)", n_runs * num_replicates * num_blocks)
+    
+    if "d_efficiency" not in diagnostics:
+        st.warning(
+            f"⚠️ The {diagnostics['model']} model has {diagnostics['n_terms']} terms but the design only supports "
+            f"rank {diagnostics['rank']}; choose a simpler model or a larger design."
+        )
+        return
+    
+    col_e1, col_e2, col_e3 = st.columns(3)
+    with col_e1:
+        st.metric("D-efficiency", f"{diagnostics['d_efficiency']:.1f}%")
+    with col_e2:
+        st.metric("A-efficiency", f"{diagnostics['a_efficiency']:.1f}%")
+    with col_e3:
+        st.metric("G-efficiency", f"{diagnostics['g_efficiency']:.1f}%")
+    
+    col_d1, col_d2, col_d3 = st.columns(3)
+    with col_d1:
+        st.metric("Condition No.", f"{diagnostics['condition_number']:.1f}")
+    with col_d2:
+        max_vif = diagnostics["vif"].max() if "vif" in diagnostics else 1.0
+        st.metric("Max VIF", f"{max_vif:.2f}")
+    with col_d3:
+        st.metric("Residual df", diagnostics["residual_df"],
+                  help=f"Pure error: {diagnostics['pure_error_df']} df, lack of fit: {diagnostics['lack_of_fit_df']} df")
+    
+    if "vif" in diagnostics:
+        with st.expander("VIFs & Term Correlations", expanded=False):
+            st.dataframe(diagnostics["vif"].round(2).to_frame().T, use_container_width=True)
+            correlation = diagnostics["correlation"]
+            fig_corr = go.Figure(data=go.Heatmap(
+                z=correlation.values,
+                x=correlation.columns,
+                y=correlation.index,
+                zmin=-1,
+                zmax=1,
+                colorscale="RdBu",
+                reversescale=True
+            ))
+            fig_corr.update_layout(height=400, margin=dict(l=10, r=10, t=10, b=10))
+            st.plotly_chart(fig_corr, use_container_width=True)
+
+
+def _beta_continued_fraction(x, a, b, n_iter=300, eps=1e-14):
+    """Continued fraction for the incomplete beta function (modified Lentz), vectorized over x."""
+    tiny = 1e-300
+    c = np.ones_like(x)
+    d = 1.0 - (a + b) * x / (a + 1.0)
+    d = 1.0 / np.where(np.abs(d) < tiny, tiny, d)
+    h = d.copy()
+    for m in range(1, n_iter + 1):
+        for aa in (m * (b - m) * x / ((a + 2 * m - 1.0) * (a + 2 * m)),
+                   -(a + m) * (a + b + m) * x / ((a + 2 * m) * (a + 2 * m + 1.0))):
+            d = 1.0 + aa * d
+            d = 1.0 / np.where(np.abs(d) < tiny, tiny, d)
+            c = 1.0 + aa / c
+            c = np.where(np.abs(c) < tiny, tiny, c)
+            h = h * d * c
+        if np.all(np.abs(d * c - 1.0) < eps):
+            break
+    return h
+
+
+def regularized_beta(x, a, b):
+    """Regularized incomplete beta function I_x(a, b), vectorized over x."""
+    x = np.clip(np.asarray(x, dtype=float), 0.0, 1.0)
+    inner = np.clip(x, 1e-300, 1.0 - 1e-16)
+    log_front = lgamma(a + b) - lgamma(a) - lgamma(b) + a * np.log(inner) + b * np.log1p(-inner)
+    front = np.exp(log_front)
+    direct = x < (a + 1.0) / (a + b + 2.0)
+    result = np.where(
+        direct,
+        front * _beta_continued_fraction(inner, a, b) / a,
+        1.0 - front * _beta_continued_fraction(1.0 - inner, b, a) / b
+    )
+    return np.where(x <= 0.0, 0.0, np.where(x >= 1.0, 1.0, result))
+
+
+def t_two_sided_p(t, df):
+    """Two-sided p-value of Student's t statistic with df degrees of freedom."""
+    t = np.asarray(t, dtype=float)
+    return regularized_beta(df / (df + t ** 2), df / 2.0, 0.5)
+
+
+def t_critical(alpha, df):
+    """
+    Two-sided critical value t such that P(|T| > t) = alpha, by repeated grid
+    refinement of the (decreasing) p-value: each pass is one vectorized evaluation.
+    """
+    low, high = 0.0, 1e3
+    for _ in range(8):
+        grid = np.linspace(low, high, 65)
+        i = max(int((t_two_sided_p(grid, df) > alpha).sum()) - 1, 0)
+        low, high = grid[i], grid[min(i + 1, 64)]
+    return 0.5 * (low + high)
+
+
+def f_survival(f, df1, df2):
+    """Upper-tail probability P(F > f) of the F distribution."""
+    f = np.maximum(np.asarray(f, dtype=float), 0.0)
+    return regularized_beta(df2 / (df2 + df1 * f), df2 / 2.0, df1 / 2.0)
+
+
+def term_effect_sizes(terms, main_effect, interaction_effect, quadratic_effect):
+    """
+    True coefficients (coded units) for a power simulation: a term with effect size
+    delta (response change from the low to the high level) gets coefficient delta / 2.
+    """
+    beta = np.zeros(len(terms))
+    for i, term in enumerate(terms):
+        if term == "Intercept":
+            continue
+        if term.endswith("^2"):
+            beta[i] = quadratic_effect / 2.0
+        elif "*" in term:
+            beta[i] = interaction_effect / 2.0
+        else:
+            beta[i] = main_effect / 2.0
+    return beta
+
+
+def simulate_power(design_matrix, beta, noise_sd, replicate_counts, num_blocks=1, alpha=0.05, n_sims=2000, seed=0):
+    """
+    Monte Carlo power of the t-test of every model term versus replicate count.
+
+    For each replicate count the design is stacked replicates x blocks times with
+    fixed block effects, and factorized once (QR). Each simulated dataset
+    y = X beta + noise is fitted through that factorization; because block shifts
+    lie in the column space of X they only cost degrees of freedom. With
+    Q'y ~ N(R beta, sigma^2 I) and RSS ~ sigma^2 chi^2(N - p) all simulations of
+    one replicate count are fitted as a single batched triangular solve.
+    Returns a DataFrame (rows = replicate counts, columns = terms) of power in [0, 1].
+    """
+    rng = np.random.default_rng(seed)
+    n_points, n_terms = design_matrix.shape
+    power = {}
+    for n_rep in replicate_counts:
+        stacked = np.tile(design_matrix, (n_rep * num_blocks, 1))
+        blocks = np.kron(np.eye(num_blocks)[:, 1:], np.ones((n_points * n_rep, 1)))
+        X = np.hstack([stacked, blocks])
+        df = X.shape[0] - X.shape[1]
+        if df < 1 or np.linalg.matrix_rank(X) < X.shape[1]:
+            power[n_rep] = np.full(n_terms, np.nan)
+            continue
+        
+        _, R = np.linalg.qr(X)
+        R_inv = np.linalg.inv(R)
+        projected = (R @ np.concatenate([beta, np.zeros(X.shape[1] - n_terms)]))[:, None] \
+            + noise_sd * rng.standard_normal((X.shape[1], n_sims))
+        coef = (R_inv @ projected)[:n_terms]
+        sigma_hat = np.sqrt(noise_sd ** 2 * rng.chisquare(df, n_sims) / df)
+        std_err = np.sqrt((R_inv[:n_terms] ** 2).sum(axis=1))[:, None] * sigma_hat[None, :]
+        power[n_rep] = (np.abs(coef / std_err) > t_critical(alpha, df)).mean(axis=1)
+    
+    return pd.DataFrame.from_dict(power, orient="index")
+
+
+def split_plot_anova(values, factor_names, ranges_dict, whole_plots, whole_plot_factors, response, model="Interactions"):
+    """
+    Two-stratum split-plot ANOVA by orthogonal projection (method of moments, no REML).
+
+    The response is split into whole-plot means and within-whole-plot deviations.
+    Terms built only from whole-plot factors are tested in the whole-plot stratum
+    against whole-plot error (df = whole plots - whole-plot parameters); terms that
+    involve a subplot factor are tested within whole plots against subplot error.
+    Each term's sum of squares is the increase in its stratum's residual when the
+    term is dropped, which is exact for balanced split-plot designs.
+    Returns the ANOVA table and the variance components (whole plot, subplot).
+    """
+    X, terms = build_model_matrix(values, factor_names, ranges_dict, model)
+    y = np.asarray(response, dtype=float)
+    plot_index = np.unique(np.asarray(whole_plots), return_inverse=True)[1]
+    n_plots, n_runs = plot_index.max() + 1, len(y)
+    plot_sizes = np.bincount(plot_index)
+    
+    def plot_means(a):
+        sums = np.zeros((n_plots,) + a.shape[1:])
+        np.add.at(sums, plot_index, a)
+        return (sums / plot_sizes.reshape((-1,) + (1,) * (a.ndim - 1)))[plot_index]
+    
+    def residual_ss(A, b):
+        if A.shape[1] == 0:
+            return float(b @ b)
+        coef = np.linalg.lstsq(A, b, rcond=None)[0]
+        return float(((b - A @ coef) ** 2).sum())
+    
+    whole_plot_term = np.array([
+        term == "Intercept" or all((part[:-2] if part.endswith("^2") else part) in whole_plot_factors for part in term.split("*"))
+        for term in terms
+    ])
+    strata = {
+        "Whole plot": (plot_means(X[:, whole_plot_term]), plot_means(y), n_plots),
+        "Subplot": (X[:, ~whole_plot_term] - plot_means(X[:, ~whole_plot_term]), y - plot_means(y), n_runs - n_plots),
+    }
+    
+    rows, error_ms = [], {}
+    for stratum, (A, b, n_obs) in strata.items():
+        names = [t for t, wp in zip(terms, whole_plot_term) if wp == (stratum == "Whole plot")]
+        rank = np.linalg.matrix_rank(A) if A.shape[1] else 0
+        error_df = n_obs - rank
+        error_ss = residual_ss(A, b)
+        error_ms[stratum] = error_ss / error_df if error_df > 0 else np.nan
+        for j, name in enumerate(names):
+            if name == "Intercept":
+                continue
+            term_ss = residual_ss(np.delete(A, j, axis=1), b) - error_ss
+            f_value = term_ss / error_ms[stratum] if error_df > 0 and error_ms[stratum] > 0 else np.nan
+            rows.append({"Source": name, "Stratum": stratum, "df": 1, "SS": term_ss, "MS": term_ss, "F": f_value,
+                         "p-value": float(f_survival(f_value, 1, error_df)) if np.isfinite(f_value) else np.nan})
+        rows.append({"Source": f"{stratum} error", "Stratum": stratum, "df": error_df, "SS": error_ss,
+                     "MS": error_ms[stratum], "F": np.nan, "p-value": np.nan})
+    
+    # E[MS whole-plot error] = sigma2_subplot + (runs per whole plot) sigma2_whole_plot
+    subplot_var = error_ms["Subplot"]
+    whole_plot_var = max((error_ms["Whole plot"] - subplot_var) / (n_runs / n_plots), 0.0)
+    return pd.DataFrame(rows), {"Whole plot": whole_plot_var, "Subplot": subplot_var}
+
+
+def normal_cdf(z):
+    """Standard normal CDF from the Abramowitz & Stegun 7.1.26 erf approximation (|error| < 1.5e-7)."""
+    z = np.asarray(z, dtype=float)
+    x = np.abs(z) / np.sqrt(2.0)
+    t = 1.0 / (1.0 + 0.3275911 * x)
+    poly = t * (0.254829592 + t * (-0.284496736 + t * (1.421413741 + t * (-1.453152027 + t * 1.061405429))))
+    return 0.5 * (1.0 + np.sign(z) * (1.0 - poly * np.exp(-x * x)))
+
+
+def normal_pdf(z):
+    """Standard normal density."""
+    return np.exp(-0.5 * np.asarray(z, dtype=float) ** 2) / np.sqrt(2.0 * np.pi)
+
+
+def matern52_kernel(A, B, length_scale):
+    """Matérn 5/2 correlation between the rows of A and B (coded units, unit signal variance)."""
+    sq_dist = (A ** 2).sum(axis=1)[:, None] + (B ** 2).sum(axis=1)[None, :] - 2.0 * A @ B.T
+    r = np.sqrt(5.0 * np.maximum(sq_dist, 0.0)) / length_scale
+    return (1.0 + r + r ** 2 / 3.0) * np.exp(-r)
+
+
+GP_LENGTH_SCALES = [0.3, 0.5, 0.8, 1.2, 2.0, 3.0]
+GP_NOISE_VARIANCES = [1e-4, 1e-2, 0.05, 0.2, 0.5]
+
+
+def gp_fit(keys, X, y, length_scale, noise_var, y_mean=None, y_scale=None):
+    """
+    Gaussian-process posterior state on standardized targets: the Cholesky factor L
+    of K + noise I, its inverse (so later solves are matrix-vector products) and
+    alpha = (K + noise I)^-1 y. keys identify the observations for incremental updates.
+    """
+    y = np.asarray(y, dtype=float)
+    y_mean = y.mean() if y_mean is None else y_mean
+    y_scale = (y.std() or 1.0) if y_scale is None else y_scale
+    L = np.linalg.cholesky(matern52_kernel(X, X, length_scale) + noise_var * np.eye(len(X)))
+    L_inv = np.linalg.inv(L)
+    z = (y - y_mean) / y_scale
+    return {
+        "keys": list(keys), "X": X, "y": y, "y_mean": y_mean, "y_scale": y_scale,
+        "length_scale": length_scale, "noise_var": noise_var,
+        "L": L, "L_inv": L_inv, "alpha": L_inv.T @ (L_inv @ z),
+    }
+
+
+def gp_log_marginal_likelihood(gp):
+    """Log marginal likelihood of the standardized targets under the GP's hyperparameters."""
+    z = (gp["y"] - gp["y_mean"]) / gp["y_scale"]
+    return -0.5 * z @ gp["alpha"] - np.log(np.diag(gp["L"])).sum() - 0.5 * len(z) * np.log(2.0 * np.pi)
+
+
+def gp_update(gp, keys, X_new, y_new):
+    """
+    Add observations to a GP without refactorizing: the Cholesky factor and its
+    inverse are extended block-wise at O(n^2 m) cost for m new points, with the
+    hyperparameters and target standardization of the existing fit.
+    """
+    K_cross = matern52_kernel(gp["X"], X_new, gp["length_scale"])
+    K_new = matern52_kernel(X_new, X_new, gp["length_scale"]) + gp["noise_var"] * np.eye(len(X_new))
+    L21 = (gp["L_inv"] @ K_cross).T
+    L22 = np.linalg.cholesky(K_new - L21 @ L21.T)
+    L22_inv = np.linalg.inv(L22)
+    n, m = len(gp["X"]), len(X_new)
+    
+    L = np.block([[gp["L"], np.zeros((n, m))], [L21, L22]])
+    L_inv = np.block([[gp["L_inv"], np.zeros((n, m))], [-L22_inv @ L21 @ gp["L_inv"], L22_inv]])
+    y = np.concatenate([gp["y"], np.asarray(y_new, dtype=float)])
+    z = (y - gp["y_mean"]) / gp["y_scale"]
+    return {**gp, "keys": gp["keys"] + list(keys), "X": np.vstack([gp["X"], X_new]), "y": y,
+            "L": L, "L_inv": L_inv, "alpha": L_inv.T @ (L_inv @ z)}
+
+
+def gp_posterior(keys, X, y, previous=None):
+    """
+    GP for the current observations. When every observation of the previous fit is
+    still present with the same response, only the new ones are added (gp_update);
+    otherwise hyperparameters are re-selected by maximum marginal likelihood over
+    GP_LENGTH_SCALES x GP_NOISE_VARIANCES and the GP is refitted.
+    """
+    keys, y = list(keys), np.asarray(y, dtype=float)
+    if previous is not None:
+        position = {key: i for i, key in enumerate(keys)}
+        old = [position.get(key) for key in previous["keys"]]
+        if None not in old and np.allclose(y[old], previous["y"]) and np.allclose(X[old], previous["X"]):
+            new = np.setdiff1d(np.arange(len(keys)), old)
+            if len(new) == 0:
+                return previous
+            return gp_update(previous, [keys[i] for i in new], X[new], y[new])
+    
+    fits = [gp_fit(keys, X, y, ls, noise) for ls in GP_LENGTH_SCALES for noise in GP_NOISE_VARIANCES]
+    return max(fits, key=gp_log_marginal_likelihood)
+
+
+def gp_predict(gp, Xq):
+    """Posterior mean and standard deviation (response units) of the latent function at Xq."""
+    K_query = matern52_kernel(Xq, gp["X"], gp["length_scale"])
+    v = gp["L_inv"] @ K_query.T
+    mean = K_query @ gp["alpha"]
+    var = np.maximum(1.0 - (v ** 2).sum(axis=0), 1e-12)
+    return gp["y_mean"] + gp["y_scale"] * mean, gp["y_scale"] * np.sqrt(var)
+
+
+def local_penalization_batch(gp, candidates, batch_size, maximize=True):
+    """
+    Greedy batch selection by local penalization (González et al., 2016). Expected
+    improvement over the best observation is multiplied, for every point x_j
+    already in the batch, by Phi((Lip ||x - x_j|| - M + mu(x_j)) / sigma(x_j)): the
+    probability that x lies outside the ball that could hold the optimum near x_j,
+    with Lip the largest gradient norm of the GP mean over the candidates and M the best response.
+    Returns candidate indices and the EI of every candidate.
+    """
+    sign = 1.0 if maximize else -1.0
+    mean, sd = gp_predict(gp, candidates)
+    mean *= sign
+    best = (sign * gp["y"]).max()
+    z = (mean - best) / sd
+    ei = sd * (z * normal_cdf(z) + normal_pdf(z))
+    
+    # Central differences of the mean along each coded axis
+    step = 1e-3
+    probe = np.vstack([candidates + step * e for e in np.eye(candidates.shape[1])]
+                      + [candidates - step * e for e in np.eye(candidates.shape[1])])
+    probe_mean = sign * gp_predict(gp, probe)[0].reshape(2, candidates.shape[1], len(candidates))
+    lipschitz = max(float(np.sqrt((((probe_mean[0] - probe_mean[1]) / (2 * step)) ** 2).sum(axis=0)).max()), 1e-7)
+    
+    log_acquisition = np.log(np.maximum(ei, 1e-300))
+    chosen = []
+    for _ in range(min(batch_size, len(candidates))):
+        j = int(np.argmax(log_acquisition))
+        chosen.append(j)
+        distance = np.sqrt(((candidates - candidates[j]) ** 2).sum(axis=1))
+        penalty = normal_cdf((lipschitz * distance - best + mean[j]) / sd[j])
+        log_acquisition += np.log(np.maximum(penalty, 1e-300))
+        log_acquisition[j] = -np.inf
+    return np.array(chosen), ei
+
+
+def propose_bayesian_batch(gp, ranges_dict, volume_params, batch_size=24, maximize=True, n_candidates=8192, seed=0):
+    """
+    Next plate of formulations: a scrambled Sobol pool over the factor ranges, cut
+    to points that pass the molar-sum and pipetting checks, then a local-penalization batch.
+    Returns the proposals (physical units) with predicted mean, sd and EI.
+    """
+    factor_names = list(ranges_dict.keys())
+    bounds = np.array([ranges_dict[f] for f in factor_names], dtype=float)
+    pool = bounds[:, 0] + sobol_points(n_candidates, len(factor_names), scramble="Owen", seed=seed) * (bounds[:, 1] - bounds[:, 0])
+    pool = pool[composition_feasible_mask(pool, factor_names) & volume_feasible_mask(pool, factor_names, volume_params)]
+    if len(pool) == 0:
+        raise ValueError("No feasible formulations inside the factor ranges")
+    
+    coded_pool = (pool - bounds.mean(axis=1)) / ((bounds[:, 1] - bounds[:, 0]) / 2)
+    chosen, ei = local_penalization_batch(gp, coded_pool, batch_size, maximize)
+    mean, sd = gp_predict(gp, coded_pool[chosen])
+    proposals = pd.DataFrame(pool[chosen], columns=factor_names)
+    proposals["Predicted_Mean"] = mean
+    proposals["Predicted_SD"] = sd
+    proposals["Expected_Improvement"] = ei[chosen]
+    return proposals
+
+
+def encode_design(design_df, ranges_dict):
+    """Inverse of decode_coded_design: physical units -> coded units (-1 = low, +1 = high)."""
+    factor_names = list(ranges_dict.keys())
+    bounds = np.array([ranges_dict[f] for f in factor_names], dtype=float)
+    return (design_df[factor_names].to_numpy(dtype=float) - bounds.mean(axis=1)) / ((bounds[:, 1] - bounds[:, 0]) / 2)
+
+
+def foldover_runs(design_df, ranges_dict, factors=None):
     """
-    Normalize three components so that Ionizable + Cholesterol + PEG + Helper = 100%.
-    Returns None if the combination is invalid (would result in negative Helper %).
+    Foldover of an existing design: reflect every factor (full foldover) or only
+    the listed factors (partial foldover) about the center of its range.
     """
-    helper_pct = 100.0 - ionizable_pct - cholesterol_pct - peg_pct
-    if helper_pct < 0:
-        return None
-    return ionizable_pct, helper_pct, cholesterol_pct, peg_pct
+    coded = encode_design(design_df, ranges_dict)
+    factor_names = list(ranges_dict.keys())
+    reflect = np.array([factors is None or f in factors for f in factor_names])
+    return decode_coded_design(np.where(reflect, -coded, coded), ranges_dict)
 
 
-def filter_valid_design_points(design_df, min_helper_pct=0.5):
+def axial_runs(ranges_dict, alpha=1.0):
+    """Axial (star) points at +/-alpha on every factor axis, turning a factorial into a CCD."""
+    return decode_coded_design(np.kron(np.eye(len(ranges_dict)), [[-alpha], [alpha]]), ranges_dict)
+
+
+def center_runs(ranges_dict, n_center=3):
+    """Replicated center points."""
+    return decode_coded_design(np.zeros((n_center, len(ranges_dict))), ranges_dict)
+
+
+def d_optimal_augment_runs(design_df, ranges_dict, n_new, model="Quadratic", n_starts=8, min_helper_pct=0.5, seed=0):
     """
-    Filter DOE design points to ensure all molar ratios are valid.
-    
-    A valid combination requires:
-    Ionizable + Cholesterol + PEG + Helper = 100%
-    And Helper >= min_helper_pct (default 0.5%)
-    
-    This removes points where the sum of Ion + Chol + PEG > 100% - min_helper_pct
+    D-optimal augmentation: choose n_new feasible runs that maximize det(X'X) of
+    the combined design while the runs already performed stay fixed.
     """
-    if not {"Ionizable_%", "Cholesterol_%", "PEG_%"}.issubset(design_df.columns):
-        return design_df  # If not all columns present, return unchanged
-    
-    valid_mask = (
-        design_df["Ionizable_%"] + 
-        design_df["Cholesterol_%"] + 
-        design_df["PEG_%"]
-    ) <= (100.0 - min_helper_pct)
-    
-    filtered_df = design_df[valid_mask].reset_index(drop=True)
-    
-    # Report filtering results
-    n_original = len(design_df)
-    n_filtered = len(filtered_df)
-    n_removed = n_original - n_filtered
+    factor_names = list(ranges_dict.keys())
+    candidates = optimal_design_candidates(ranges_dict, min_helper_pct, seed=seed)
+    if len(candidates) == 0:
+        raise ValueError("No feasible candidate formulations inside the selected ranges")
     
-    if n_removed > 0:
-        st.warning(
-            f"⚠️ **Design Space Constraint**: {n_removed} of {n_original} design points removed "
-            f"because Ionizable + Cholesterol + PEG > 100%. "
-            f"Remaining valid points: {n_filtered}"
-        )
+    candidate_matrix, terms = build_model_matrix(candidates, factor_names, ranges_dict, model)
+    existing_matrix, _ = build_model_matrix(design_df[factor_names].to_numpy(dtype=float), factor_names, ranges_dict, model)
+    if len(existing_matrix) + n_new < len(terms):
+        raise ValueError(f"The {model} model has {len(terms)} terms; add at least {len(terms) - len(existing_matrix)} runs")
     
-    return filtered_df
+    selected, _ = _best_of_starts(
+        lambda rng: fedorov_exchange(candidate_matrix, n_new, rng, fixed_matrix=existing_matrix), n_starts, seed
+    )
+    return pd.DataFrame(candidates[selected], columns=factor_names)
 
 
-def generate_2level_factorial(ranges_dict):
-    """Generate 2-level full factorial design."""
-    design_points = list(itertools.product([-1, 1], repeat=len(ranges_dict)))
-    factor_names = list(ranges_dict.keys())
-    scaled_points = []
-    
-    for point in design_points:
-        scaled_point = {}
-        for i, factor in enumerate(factor_names):
-            min_val, max_val = ranges_dict[factor]
-            scaled_point[factor] = min_val + (point[i] + 1) / 2 * (max_val - min_val)
-        scaled_points.append(scaled_point)
-    
-    return pd.DataFrame(scaled_points)
+# Grid spacing below which two design points count as the same formulation
+MERGE_TOLERANCES = {
+    **{c: 0.01 for c in MIXTURE_COMPONENTS},  # molar %
+    "Ion_DNA_Ratio": 0.01,  # mass ratio
+    "Aq_EtOH_Ratio": 0.01,
+    "DNA_Mass_ug": 0.01,
+    "Amines_per_Molecule": 0.01,
+}
+MERGE_DEFAULT_TOLERANCE = 0.001  # stock concentrations (ug/uL)
 
 
-def generate_3level_factorial(ranges_dict):
-    """Generate 3-level full factorial design."""
-    factor_names = list(ranges_dict.keys())
-    levels = {}
-    
-    for factor, (min_val, max_val) in ranges_dict.items():
-        levels[factor] = [min_val, (min_val + max_val) / 2, max_val]
-    
-    all_combos = itertools.product(*[levels[f] for f in factor_names])
-    design_data = [{factor_names[i]: val for i, val in enumerate(combo)} for combo in all_combos]
-    
-    return pd.DataFrame(design_data)
+def design_point_keys(values, factor_names, tolerances=None):
+    """
+    One 64-bit hash per design point after snapping every factor to its tolerance
+    grid, so formulations that differ by less than the tolerance share a key.
+    """
+    tolerances = {**MERGE_TOLERANCES, **(tolerances or {})}
+    steps = np.array([tolerances.get(f, MERGE_DEFAULT_TOLERANCE) for f in factor_names])
+    grid = np.rint(np.asarray(values, dtype=float) / steps).astype(np.int64)
+    return pd.util.hash_pandas_object(pd.DataFrame(grid), index=False).to_numpy()
 
 
-def generate_fractional_factorial(ranges_dict):
-    """Generate fractional factorial (subset of 2-level design)."""
-    full_design = generate_2level_factorial(ranges_dict)
-    fraction = min(16, len(full_design))
-    sampled = full_design.sample(n=fraction, random_state=42).reset_index(drop=True)
-    return sampled
+def merge_designs(designs, volume_params, tolerances=None):
+    """
+    Merge design_dfs (name -> DataFrame) into one design of unique formulations.
 
+    Every design is expressed on the union of their factors, with factors a design
+    does not vary taken from its own run parameters (Stage 1 settings, balance lipid).
+    Points are grouped by hashing their tolerance-grid keys, which is O(n) within
+    and across designs; the first occurrence is kept. Sources lists every
+    "<design> #<experiment>" that mapped onto the point.
+    """
+    factor_names = list(dict.fromkeys(f for df in designs.values() for f in df.columns if f in DESIGN_FACTOR_PARAMS))
+    if "Helper_%" in factor_names and "Cholesterol_%" in factor_names:
+        factor_names.remove("Helper_%")  # implied by the other lipids once cholesterol is explicit
+    
+    blocks, labels = [], []
+    for name, df in designs.items():
+        columns = [f for f in df.columns if f in DESIGN_FACTOR_PARAMS]
+        run_params = design_run_parameters(df[columns].to_numpy(dtype=float), columns, volume_params)
+        blocks.append(np.column_stack([run_params[DESIGN_FACTOR_PARAMS[f]] for f in factor_names]))
+        labels.append(np.char.add(f"{name} #", (df.index.to_numpy() + 1).astype(str)))
+    values = np.vstack(blocks) if blocks else np.empty((0, len(factor_names)))
+    labels = np.concatenate(labels) if labels else np.empty(0, dtype=str)
+    
+    codes, uniques = pd.factorize(design_point_keys(values, factor_names, tolerances))
+    first = np.full(len(uniques), len(values))
+    np.minimum.at(first, codes, np.arange(len(values)))
+    
+    counts = np.bincount(codes, minlength=len(uniques))
+    sources = labels[first].astype(object)
+    shared = counts[codes] > 1  # only points with duplicates need their labels joined
+    if shared.any():
+        joined = pd.Series(labels[shared]).groupby(codes[shared]).agg(", ".join)
+        sources[joined.index.to_numpy()] = joined.to_numpy()
+    
+    merged = pd.DataFrame(values[first], columns=factor_names)
+    merged["Sources"] = sources
+    merged["N_Sources"] = counts
+    merged.attrs["n_input"] = len(values)
+    return merged
 
-def generate_plackett_burman(ranges_dict):
-    """Generate Plackett-Burman screening design."""
-    n_factors = len(ranges_dict)
-    factor_names = list(ranges_dict.keys())
-    
-    # Standard PB matrix for 12 runs, 11 factors (can handle 4 factors)
-    pb_matrix = np.array([
-        [1, 1, 1, 1],
-        [1, -1, 1, -1],
-        [1, 1, -1, 1],
-        [1, 1, 1, -1],
-        [-1, 1, 1, 1],
-        [-1, -1, 1, 1],
-        [-1, -1, -1, 1],
-        [-1, -1, -1, -1],
-        [-1, 1, -1, -1],
-        [-1, 1, 1, -1],
-        [1, -1, -1, -1],
-        [1, 1, -1, 1],
-    ])
-    
-    design_points = []
-    for point in pb_matrix[:min(12, 2**(n_factors+1))]:
-        scaled_point = {}
-        for i, factor in enumerate(factor_names[:n_factors]):
-            min_val, max_val = ranges_dict[factor]
-            scaled_point[factor] = min_val + (point[i] + 1) / 2 * (max_val - min_val)
-        design_points.append(scaled_point)
-    
-    return pd.DataFrame(design_points)
 
+# Formulation space for comparing against previously tested runs, with the width that counts as one unit
+HISTORY_FACTOR_SCALES = {
+    "Ionizable_%": 10.0,
+    "Cholesterol_%": 10.0,
+    "PEG_%": 2.0,
+    "Ion_DNA_Ratio": 10.0,
+    "Aq_EtOH_Ratio": 1.0,
+}
 
-def generate_box_behnken(ranges_dict):
-    """Generate Box-Behnken design."""
-    factor_names = list(ranges_dict.keys())
-    center = [np.mean(ranges_dict[f]) for f in factor_names]
-    design_points = [center.copy()]
-    
-    # Axial points
-    for i, factor in enumerate(factor_names):
-        for val in [ranges_dict[factor][0], ranges_dict[factor][1]]:
-            point = center.copy()
-            point[i] = val
-            design_points.append(point)
-    
-    design_data = [{factor_names[i]: val for i, val in enumerate(point)} for point in design_points]
-    return pd.DataFrame(design_data)
+# Run sheet column names accepted for history factors
+HISTORY_COLUMN_ALIASES = {"Ion_DNA_Target": "Ion_DNA_Ratio"}
 
 
-def generate_central_composite(ranges_dict):
-    """Generate Central Composite Design."""
-    factor_names = list(ranges_dict.keys())
-    n_factors = len(factor_names)
-    
-    # Factorial part - use 2-level factorial
-    factorial_df = generate_2level_factorial(ranges_dict)
-    design_points = [dict(row) for _, row in factorial_df.iterrows()]
-    
-    center = [np.mean(ranges_dict[f]) for f in factor_names]
-    
-    # Axial points
-    alpha = np.sqrt(n_factors)
-    for i, factor in enumerate(factor_names):
-        for sign in [-1, 1]:
-            point = center.copy()
-            min_val, max_val = ranges_dict[factor]
-            range_val = (max_val - min_val) / 2
-            point[i] = center[i] + sign * alpha * range_val / 2
-            design_points.append({factor_names[j]: point[j] for j in range(len(factor_names))})
-    
-    # Center point
-    design_points.append({factor_names[i]: center[i] for i in range(len(factor_names))})
-    
-    return pd.DataFrame(design_points)
+def formulation_history_points(history_df, volume_params):
+    """
+    Normalized history coordinates (HISTORY_FACTOR_SCALES units) for a table of
+    tested formulations, e.g. earlier run sheets, or a design. Columns a table
+    lacks take the Stage 1 setting; rows with unreadable values come out as NaN.
+    """
+    history_df = history_df.rename(columns=HISTORY_COLUMN_ALIASES)
+    columns = [f for f in history_df.columns if f in DESIGN_FACTOR_PARAMS]
+    values = history_df[columns].apply(pd.to_numeric, errors="coerce").to_numpy(dtype=float)
+    run_params = design_run_parameters(values, columns, volume_params)
+    return np.column_stack([run_params[DESIGN_FACTOR_PARAMS[f]] / scale for f, scale in HISTORY_FACTOR_SCALES.items()])
 
 
-def generate_mixture_design(ranges_dict):
-    """Generate Mixture Design (simplex lattice)."""
-    factor_names = list(ranges_dict.keys())
-    design_points = list(itertools.product([0, 0.5, 1], repeat=len(factor_names)))
-    
-    valid_points = []
-    for point in design_points:
-        total = sum(point)
-        if total > 0:
-            normalized = tuple(p / total for p in point)
-            scaled = {}
-            for i, factor in enumerate(factor_names):
-                min_val, max_val = ranges_dict[factor]
-                scaled[factor] = min_val + normalized[i] * (max_val - min_val)
-            valid_points.append(scaled)
-    
-    return pd.DataFrame(valid_points)
+def build_kd_tree(points, leaf_size=32):
+    """
+    Balanced KD-tree stored as flat arrays. Each node splits its points at the
+    median of its widest dimension and keeps their bounding box for pruning.
+    Leaves hold at most leaf_size points, as a contiguous slice of the permuted
+    point array.
+    """
+    points = np.asarray(points, dtype=float)
+    order = np.arange(len(points))
+    nodes = {"low": [], "high": [], "start": [], "stop": [], "left": [], "right": []}
+    
+    def add(start, stop):
+        node = len(nodes["start"])
+        block = points[order[start:stop]]
+        nodes["low"].append(block.min(axis=0))
+        nodes["high"].append(block.max(axis=0))
+        for key, value in (("start", start), ("stop", stop), ("left", -1), ("right", -1)):
+            nodes[key].append(value)
+        if stop - start > leaf_size:
+            dim = int(np.argmax(nodes["high"][node] - nodes["low"][node]))
+            mid = (start + stop) // 2
+            order[start:stop] = order[start:stop][np.argpartition(block[:, dim], mid - start)]
+            nodes["left"][node] = add(start, mid)
+            nodes["right"][node] = add(mid, stop)
+        return node
+    
+    if len(points):
+        add(0, len(points))
+    tree = {key: np.array(value) for key, value in nodes.items()}
+    tree.update({"points": points[order], "index": order})
+    return tree
+
+
+def kd_tree_nearest(tree, queries):
+    """
+    Nearest indexed point and Euclidean distance for every query row. Each query
+    descends the nearer child first and skips nodes whose bounding box is farther
+    than the best distance so far, so it visits O(log n) nodes on typical data.
+    """
+    queries = np.asarray(queries, dtype=float)
+    distances = np.full(len(queries), np.inf)
+    nearest = np.full(len(queries), -1)
+    if len(tree["points"]) == 0:
+        return distances, nearest
+    
+    low, high, left, right = tree["low"], tree["high"], tree["left"], tree["right"]
+    for q, query in enumerate(queries):
+        best, best_index, stack = np.inf, -1, [(0.0, 0)]
+        while stack:
+            box_distance, node = stack.pop()
+            if box_distance >= best:
+                continue
+            if left[node] < 0:
+                start, stop = tree["start"][node], tree["stop"][node]
+                d2 = ((tree["points"][start:stop] - query) ** 2).sum(axis=1)
+                j = int(d2.argmin())
+                if d2[j] < best:
+                    best, best_index = d2[j], tree["index"][start + j]
+                continue
+            children = np.array([left[node], right[node]])
+            gaps = np.maximum(low[children] - query, 0.0) + np.maximum(query - high[children], 0.0)
+            child_distance = (gaps ** 2).sum(axis=1)
+            for i in np.argsort(-child_distance):  # nearer child is pushed last and popped first
+                stack.append((child_distance[i], children[i]))
+        distances[q], nearest[q] = np.sqrt(best), best_index
+    return distances, nearest
+
+
+@st.cache_data(show_spinner=False, max_entries=8)
+def history_kd_tree(history_key, _points):
+    """build_kd_tree cached per history content hash, so growing histories are indexed once per change."""
+    return build_kd_tree(_points)
 
 
 def calculate_np_ratio(dna_mass_ug, ionizable_lipid_moles, amines_per_molecule=1.0):
@@ -650,86 +3077,287 @@ def calculate_np_ratio(dna_mass_ug, ionizable_lipid_moles, amines_per_molecule=1
     return np_ratio, amine_moles_umol, phosphate_moles_umol
 
 
-def calculate_volumes(
+def formulation_volumes(
     ionizable_pct, helper_pct, chol_pct, peg_pct,
     mw_ion, mw_helper, mw_chol, mw_peg,
     conc_ion, conc_helper, conc_chol, conc_peg,
-    dna_mass_ug=None,
-    dna_concentration=None,
+    dna_mass_ug,
+    dna_concentration,
     ionizable_lipid_to_dna_ratio=10.0,
-    aqueous_to_ethanol_ratio=3.0,
-    ionizable_lipid_ratio=50.0,
-    helper_lipid_ratio=10.0,
-    cholesterol_ratio=38.5,
-    pegdmg2000_ratio=1.5
+    aqueous_to_ethanol_ratio=3.0
 ):
     """
-    Convert molar percentages to pipetting volumes using pDNA formulation logic.
-    
-    This function follows the pDNA formulation approach:
-    1. Use ionizable_lipid_to_dna_ratio to calculate ionizable lipid moles
-    2. Scale other lipids based on molar ratios
-    3. Calculate volumes from masses and stock concentrations
-    4. Apply 3:1 aqueous:organic ratio with citrate buffer
-    
-    Input units:
-    - Percentages: molar %
-    - MW: g/mol  
-    - Concentrations: μg/μL (= mg/mL)
-    - DNA mass: μg
-    - DNA concentration: μg/μL (= mg/mL)
-    - ionizable_lipid_to_dna_ratio: μg ionizable per μg DNA
-    - aqueous_to_ethanol_ratio: volume ratio
-    """
-    # Calculate moles of ionizable lipid using the ionizable_lipid_to_dna_ratio
-    ionizable_lipid_moles = (dna_mass_ug * ionizable_lipid_to_dna_ratio) / mw_ion
-    
-    # Calculate moles of each lipid based on their molar ratios
-    helper_lipid_moles = ionizable_lipid_moles * helper_lipid_ratio / ionizable_lipid_ratio
-    cholesterol_moles = ionizable_lipid_moles * cholesterol_ratio / ionizable_lipid_ratio
-    pegdmg2000_moles = ionizable_lipid_moles * pegdmg2000_ratio / ionizable_lipid_ratio
-    
-    # Calculate mass of each lipid
-    ionizable_lipid_mass = ionizable_lipid_moles * mw_ion
-    helper_lipid_mass = helper_lipid_moles * mw_helper
-    cholesterol_mass = cholesterol_moles * mw_chol
-    pegdmg2000_mass = pegdmg2000_moles * mw_peg
-    
-    # Calculate final LNP volume
-    final_lnp_volume = dna_mass_ug / 0.1
+    Array form of the pDNA volume calculation. Every argument may be a scalar or a
+    NumPy array with one entry per run; results are unrounded arrays in μL.
+    """
+    ionizable_pct = np.asarray(ionizable_pct, dtype=float)
     
-    # Calculate ethanol phase volume
-    ionizable_lipid_volume = ionizable_lipid_mass / conc_ion
-    helper_lipid_volume = helper_lipid_mass / conc_helper
-    cholesterol_volume = cholesterol_mass / conc_chol
-    pegdmg2000_volume = pegdmg2000_mass / conc_peg
-    ethanol = final_lnp_volume / (aqueous_to_ethanol_ratio + 1) - ionizable_lipid_volume - helper_lipid_volume - cholesterol_volume - pegdmg2000_volume
-    ethanol_phase_volume = ionizable_lipid_volume + helper_lipid_volume + cholesterol_volume + pegdmg2000_volume + ethanol
+    # Moles of ionizable lipid from the Ion:DNA mass ratio; other lipids scale by molar ratio
+    ionizable_lipid_moles = (dna_mass_ug * np.asarray(ionizable_lipid_to_dna_ratio, dtype=float)) / mw_ion
+    helper_lipid_moles = ionizable_lipid_moles * helper_pct / ionizable_pct
+    cholesterol_moles = ionizable_lipid_moles * chol_pct / ionizable_pct
+    pegdmg2000_moles = ionizable_lipid_moles * peg_pct / ionizable_pct
     
-    # Calculate aqueous phase volume
+    # Ethanol phase: lipid stocks topped up with ethanol
+    final_lnp_volume = dna_mass_ug / 0.1
+    ionizable_lipid_volume = ionizable_lipid_moles * mw_ion / conc_ion
+    helper_lipid_volume = helper_lipid_moles * mw_helper / conc_helper
+    cholesterol_volume = cholesterol_moles * mw_chol / conc_chol
+    pegdmg2000_volume = pegdmg2000_moles * mw_peg / conc_peg
+    lipid_volume = ionizable_lipid_volume + helper_lipid_volume + cholesterol_volume + pegdmg2000_volume
+    ethanol = final_lnp_volume / (aqueous_to_ethanol_ratio + 1) - lipid_volume
+    
+    # Aqueous phase: DNA, 10% citrate buffer, water top-up
     aqueous_phase_volume = final_lnp_volume * (aqueous_to_ethanol_ratio / (aqueous_to_ethanol_ratio + 1))
     dna_volume = dna_mass_ug / dna_concentration
     citrate_volume = 0.1 * aqueous_phase_volume
     water_volume = aqueous_phase_volume - dna_volume - citrate_volume
     
-    # Calculate total volume
-    total = ionizable_lipid_volume + helper_lipid_volume + cholesterol_volume + pegdmg2000_volume + ethanol + dna_volume + citrate_volume + water_volume
-    
     return {
-        "Ionizable_Vol_uL": round(ionizable_lipid_volume, 2),
-        "Helper_Vol_uL": round(helper_lipid_volume, 2),
-        "Chol_Vol_uL": round(cholesterol_volume, 2),
-        "PEG_Vol_uL": round(pegdmg2000_volume, 2),
-        "Ethanol_Vol_uL": round(ethanol, 2),
-        "DNA_Vol_uL": round(dna_volume, 2),
-        "Citrate_Vol_uL": round(citrate_volume, 2),
-        "Water_Vol_uL": round(water_volume, 2),
-        "Total_Vol_uL": round(total, 2),
-        "Ionizable_Moles": ionizable_lipid_moles,  # Return ionizable moles for N/P calculation
-        "Phosphate_Moles": dna_mass_ug * 1e-6 / 330.0 * 1e6  # phosphate moles in μmol
+        "Ionizable_Vol_uL": ionizable_lipid_volume,
+        "Helper_Vol_uL": helper_lipid_volume,
+        "Chol_Vol_uL": cholesterol_volume,
+        "PEG_Vol_uL": pegdmg2000_volume,
+        "Ethanol_Vol_uL": ethanol,
+        "DNA_Vol_uL": np.broadcast_to(dna_volume, np.shape(ethanol)),
+        "Citrate_Vol_uL": np.broadcast_to(citrate_volume, np.shape(ethanol)),
+        "Water_Vol_uL": np.broadcast_to(water_volume, np.shape(ethanol)),
+        "Total_Vol_uL": lipid_volume + ethanol + dna_volume + citrate_volume + water_volume,
+        "Ionizable_Moles": ionizable_lipid_moles,
     }
 
 
+# Design columns that override a per-run formulation parameter (keys of volume_params)
+DESIGN_FACTOR_PARAMS = {
+    "Ionizable_%": "ionizable_lipid_ratio",
+    "Cholesterol_%": "cholesterol_ratio",
+    "PEG_%": "pegdmg2000_ratio",
+    "Ion_DNA_Ratio": "ionizable_lipid_to_dna_ratio",
+    **{factor: key for factor, (_, key) in PROCESS_FACTORS.items()},
+}
+
+MOLAR_RATIO_PARAMS = ["ionizable_lipid_ratio", "helper_lipid_ratio", "cholesterol_ratio", "pegdmg2000_ratio"]
+
+
+def design_run_parameters(values, factor_names, volume_params):
+    """
+    Per-run formulation parameters for a design in physical units: a copy of
+    volume_params in which every entry is an array with one value per run, taken
+    from the design column when that parameter is a DOE factor. The balance lipid
+    (Helper_%, or Cholesterol_% when Helper_% is studied) makes the molar ratios sum to 100%.
+    """
+    values = np.asarray(values, dtype=float)
+    run_params = {key: np.full(len(values), float(value)) for key, value in volume_params.items()}
+    for i, factor in enumerate(factor_names):
+        if factor in DESIGN_FACTOR_PARAMS:
+            run_params[DESIGN_FACTOR_PARAMS[factor]] = values[:, i]
+    
+    balance = "cholesterol_ratio" if "Helper_%" in factor_names else "helper_lipid_ratio"
+    run_params[balance] = 100.0 - sum(run_params[key] for key in MOLAR_RATIO_PARAMS if key != balance)
+    return run_params
+
+
+def run_volumes(run_params):
+    """formulation_volumes evaluated on a per-run parameter set from design_run_parameters."""
+    with np.errstate(divide="ignore", invalid="ignore"):
+        return formulation_volumes(
+            *(run_params[key] for key in MOLAR_RATIO_PARAMS),
+            run_params["mw_ion"], run_params["mw_helper"], run_params["mw_chol"], run_params["mw_peg"],
+            run_params["conc_ion"], run_params["conc_helper"], run_params["conc_chol"], run_params["conc_peg"],
+            dna_mass_ug=run_params["dna_mass_ug"],
+            dna_concentration=run_params["dna_concentration"],
+            ionizable_lipid_to_dna_ratio=run_params["ionizable_lipid_to_dna_ratio"],
+            aqueous_to_ethanol_ratio=run_params["aqueous_to_ethanol_ratio"]
+        )
+
+
+def volume_feasible_mask(values, factor_names, volume_params):
+    """
+    Vectorized pipetting check: True where the ethanol and water top-up volumes
+    are both non-negative for the run's own composition, stocks and scale.
+    """
+    volumes = run_volumes(design_run_parameters(values, factor_names, volume_params))
+    return (volumes["Ethanol_Vol_uL"] >= 0) & (volumes["Water_Vol_uL"] >= 0)
+
+
+def feasible_region_vertices(ranges_dict, min_helper_pct=0.5):
+    """
+    Vertices of the feasible factor region: the factor box cut by the molar sum.
+
+    Composition vertices are the box corners whose lipid percentages sum to at most
+    100% - min_helper_pct plus the extreme vertices where the plane
+    sum = 100% - min_helper_pct cuts the box (the low-balance compositions); every
+    other factor contributes the two ends of its range.
+    """
+    factor_names = list(ranges_dict.keys())
+    composition = [f for f in factor_names if f in MIXTURE_COMPONENTS]
+    others = [f for f in factor_names if f not in MIXTURE_COMPONENTS]
+    
+    composition_vertices = np.empty((1, 0))
+    if composition:
+        total = 100.0 - min_helper_pct
+        corners = np.array(list(itertools.product(*(ranges_dict[f] for f in composition))), dtype=float)
+        plane, _ = extreme_vertices([ranges_dict[f][0] for f in composition], [ranges_dict[f][1] for f in composition], total)
+        vertices = np.vstack([corners[corners.sum(axis=1) <= total + 1e-9], plane.reshape(-1, len(composition))])
+        composition_vertices = np.unique(np.round(vertices, 9), axis=0)
+    other_corners = list(itertools.product(*(ranges_dict[f] for f in others)))
+    other_corners = np.array(other_corners, dtype=float).reshape(len(other_corners), len(others))
+    
+    values = np.hstack([
+        np.repeat(composition_vertices, len(other_corners), axis=0),
+        np.tile(other_corners, (len(composition_vertices), 1))
+    ])
+    return pd.DataFrame(values, columns=composition + others)[factor_names]
+
+
+def volume_feasibility_vertices(ranges_dict, volume_params, min_helper_pct=0.5):
+    """
+    Evaluate the pipetting volumes at every vertex of the feasible factor region.
+
+    Lipid volume is linear in the Ion:DNA ratio and linear-fractional in the molar
+    percentages, so its extremes over the region (a polytope) are attained at
+    vertices: if every vertex is volume-feasible the whole region is, and if none
+    is, no design point can be.
+    """
+    vertices = feasible_region_vertices(ranges_dict, min_helper_pct)
+    vertices["Volume_OK"] = volume_feasible_mask(vertices.to_numpy(dtype=float), list(ranges_dict.keys()), volume_params)
+    return vertices
+
+
+def max_feasible_ion_dna_ratio(ranges_dict, volume_params, min_helper_pct=0.5):
+    """
+    Largest Ion:DNA ratio with non-negative ethanol, in closed form, over the vertices
+    of the feasible region of every other studied factor (composition, helper lipid,
+    aqueous:ethanol ratio, DNA scale, stock concentrations; see feasible_region_vertices).
+    Ethanol falls linearly with the ratio, so at each vertex the limit is the
+    ethanol-phase volume over the lipid-stock volume needed at a ratio of 1.
+    Returns (ratio feasible for every setting, ratio at the most favourable setting),
+    or None when no composition is valid.
+    """
+    others = {f: r for f, r in ranges_dict.items() if f != "Ion_DNA_Ratio"}
+    vertices = feasible_region_vertices(others, min_helper_pct)
+    if len(vertices) == 0:
+        return None
+    run_params = design_run_parameters(vertices.to_numpy(dtype=float), list(others), volume_params)
+    run_params["ionizable_lipid_to_dna_ratio"] = np.ones(len(vertices))
+    volumes = run_volumes(run_params)
+    lipid_volume = volumes["Ionizable_Vol_uL"] + volumes["Helper_Vol_uL"] + volumes["Chol_Vol_uL"] + volumes["PEG_Vol_uL"]
+    limits = (volumes["Ethanol_Vol_uL"] + lipid_volume) / lipid_volume
+    return float(limits.min()), float(limits.max())
+
+
+def format_run_ids(first_run_number, n_runs):
+    """Run_IDs R001, R002, ... for n_runs consecutive runs, built as one vectorized string operation."""
+    numbers = np.arange(first_run_number, first_run_number + n_runs).astype(str)
+    return np.char.add("R", np.char.zfill(numbers, 3))
+
+
+def _round_robin_matchings(n_factors):
+    """1-factorization of the complete graph on an even number of factors: n-1 perfect matchings of factor pairs."""
+    matchings = []
+    for r in range(n_factors - 1):
+        pairs = [(r, n_factors - 1)] + [((r + i) % (n_factors - 1), (r - i) % (n_factors - 1)) for i in range(1, n_factors // 2)]
+        matchings.append({tuple(sorted(p)) for p in pairs})
+    return matchings
+
+
+def orthogonal_block_labels(design_df, ranges_dict):
+    """
+    Orthogonal blocking of a central composite or Box-Behnken design (1-based block
+    label per design point).
+
+    CCD: the factorial portion and the axial portion form two blocks, with the center
+    points split so that every factor's sum of squares is proportional to block size;
+    when no split of the center points achieves this for the design's alpha, the
+    design cannot be blocked orthogonally.
+    BBD built from all factor pairs with an even number of factors: each block is a
+    perfect matching of factor pairs (k - 1 blocks) with the center points spread evenly.
+    Raises ValueError for other designs.
+    """
+    coded = np.round(encode_design(design_df, ranges_dict), 9)
+    n_factors = coded.shape[1]
+    nonzero = (np.abs(coded) > 1e-9).sum(axis=1)
+    is_center = nonzero == 0
+    n_center = int(is_center.sum())
+    labels = np.zeros(len(coded), dtype=int)
+    
+    if np.all((nonzero == n_factors) | (nonzero == 1) | is_center) and (nonzero == 1).any():
+        factorial, axial = nonzero == n_factors, nonzero == 1
+        ss_factorial = (coded[factorial] ** 2).sum(axis=0).mean()
+        ss_axial = (coded[axial] ** 2).sum(axis=0).mean()
+        split = np.arange(n_center + 1)
+        mismatch = np.abs(ss_factorial / (factorial.sum() + split) - ss_axial / (axial.sum() + n_center - split))
+        if mismatch.min() > 1e-6 * ss_factorial / factorial.sum():
+            alpha = np.abs(coded[axial]).max() / np.abs(coded[factorial]).max()
+            raise ValueError(
+                f"this central composite design (alpha = {alpha:.3f}, {n_center} center points) cannot be blocked orthogonally; "
+                f"it needs alpha = sqrt(F (2k + c_axial) / (2 (F + c_factorial))) for some split of the center points"
+            )
+        n_center_factorial = int(split[np.argmin(mismatch)])
+        labels[factorial] = 1
+        labels[axial] = 2
+        labels[np.flatnonzero(is_center)] = np.where(np.arange(n_center) < n_center_factorial, 1, 2)
+        return labels
+    
+    if np.all((nonzero == 2) | is_center) and n_factors % 2 == 0:
+        pair_rows = np.flatnonzero(nonzero == 2)
+        row_pairs = [tuple(np.flatnonzero(np.abs(coded[i]) > 1e-9)) for i in pair_rows]
+        if set(row_pairs) == set(itertools.combinations(range(n_factors), 2)):
+            matching_of = {pair: b + 1 for b, matching in enumerate(_round_robin_matchings(n_factors)) for pair in matching}
+            labels[pair_rows] = [matching_of[pair] for pair in row_pairs]
+            labels[np.flatnonzero(is_center)] = np.arange(n_center) % (n_factors - 1) + 1
+            return labels
+    
+    raise ValueError("orthogonal blocking is available for central composite designs and Box-Behnken designs built from all factor pairs with an even number of factors")
+
+
+def order_runs(run_sheet, scheme="Randomize within blocks", seed=0, design_blocks=None, first_run_number=1):
+    """
+    Reorder a run sheet and reassign Run_IDs in the new order.
+
+    Every scheme is a single sort of the row indices on (group keys, random key):
+    complete randomization ignores blocks, randomization within blocks keeps blocks
+    sequential, separated replicates run each design point once per pass within a
+    block (no identical runs back to back), and orthogonal blocks relabel Block from
+    design_blocks (experiment number -> design block) before randomizing within blocks.
+    Split-plot run sheets (Whole_Plot column) are always randomized in two stages:
+    whole plots within blocks, then runs within each whole plot, so batches stay contiguous.
+    """
+    rng = np.random.default_rng(seed)
+    n_runs = len(run_sheet)
+    random_key = rng.random(n_runs)
+    block = run_sheet["Block"].to_numpy()
+    run_sheet = run_sheet.copy()
+    
+    if scheme == "Design order":
+        order = np.arange(n_runs)
+    elif "Whole_Plot" in run_sheet.columns:
+        whole_plot = run_sheet["Whole_Plot"].to_numpy()
+        plot_key = rng.random(whole_plot.max() + 1)[whole_plot]
+        order = np.lexsort((random_key, whole_plot, plot_key, block))
+    elif scheme == "Complete randomization":
+        order = rng.permutation(n_runs)
+    elif scheme == "Separated replicates":
+        passes = run_sheet["Replicate"].to_numpy()
+        order = np.lexsort((random_key, passes, block))
+        # Where one pass ends with the point the next pass starts with, swap the first two runs of the later pass
+        experiment = run_sheet["Experiment"].to_numpy()[order]
+        group = (block * (passes.max() + 1) + passes)[order]
+        starts = np.flatnonzero((group[1:] != group[:-1]) & (experiment[1:] == experiment[:-1])) + 1
+        starts = starts[(starts + 1 < n_runs) & (group[np.minimum(starts + 1, n_runs - 1)] == group[starts])]
+        order[starts], order[starts + 1] = order[starts + 1], order[starts].copy()
+    else:
+        if scheme == "Orthogonal blocks (CCD/BBD)":
+            n_design_blocks = int(max(design_blocks.values()))
+            block = (block - 1) * n_design_blocks + run_sheet["Experiment"].map(design_blocks).to_numpy()
+            run_sheet["Block"] = block
+        order = np.lexsort((random_key, block))
+    
+    run_sheet = run_sheet.iloc[order].reset_index(drop=True)
+    run_sheet["Run_ID"] = format_run_ids(first_run_number, n_runs)
+    return run_sheet
+
+
 def generate_run_sheet(design_df, num_replicates, num_blocks, mw_ion, mw_helper, mw_chol, mw_peg,
                        conc_ion, conc_helper, conc_chol, conc_peg,
                        dna_mass_ug=None, dna_concentration=None,
@@ -739,79 +3367,90 @@ def generate_run_sheet(design_df, num_replicates, num_blocks, mw_ion, mw_helper,
                        helper_lipid_ratio=10.0,
                        cholesterol_ratio=38.5,
                        pegdmg2000_ratio=1.5,
-                       amines_per_molecule=1.0):
+                       amines_per_molecule=1.0,
+                       first_run_number=1):
     """
     Generate a complete run sheet with pipetting volumes and N/P ratios.
-    Uses pDNA formulation calculation logic.
+    Uses pDNA formulation calculation logic. Run_IDs start at first_run_number
+    so appended runs continue an existing sheet; the generation time is stored
+    once in run_sheet.attrs["Generated"].
     """
-    run_data = []
-    run_number = 1
-    
-    for block in range(num_blocks):
-        for idx, row in design_df.iterrows():
-            ion_pct = row["Ionizable_%"]
-            chol_pct = row["Cholesterol_%"]
-            peg_pct = row["PEG_%"]
-            ion_dna_ratio_target = row.get("Ion_DNA_Ratio", ionizable_lipid_to_dna_ratio)
-            
-            normalized = normalize_molar_ratios(ion_pct, chol_pct, peg_pct)
-            if normalized is None:
-                continue
-            
-            ion_pct, helper_pct, chol_pct, peg_pct = normalized
-            
-            # Use the DOE-specific Ion_DNA_Ratio if available
-            ion_dna_for_calc = ion_dna_ratio_target if ion_dna_ratio_target != "N/A" else ionizable_lipid_to_dna_ratio
-            
-            vol_dict = calculate_volumes(
-                ion_pct, helper_pct, chol_pct, peg_pct,
-                mw_ion, mw_helper, mw_chol, mw_peg,
-                conc_ion, conc_helper, conc_chol, conc_peg,
-                dna_mass_ug=dna_mass_ug,
-                dna_concentration=dna_concentration,
-                ionizable_lipid_to_dna_ratio=ion_dna_for_calc,
-                aqueous_to_ethanol_ratio=aqueous_to_ethanol_ratio,
-                ionizable_lipid_ratio=ionizable_lipid_ratio,
-                helper_lipid_ratio=helper_lipid_ratio,
-                cholesterol_ratio=cholesterol_ratio,
-                pegdmg2000_ratio=pegdmg2000_ratio
-            )
-            
-            # Calculate N/P ratio
-            ionizable_moles = vol_dict["Ionizable_Moles"]
-            phosphate_moles = vol_dict["Phosphate_Moles"]
-            amine_moles = ionizable_moles * amines_per_molecule
-            
-            np_ratio = amine_moles / phosphate_moles if phosphate_moles > 0 else 0
-            
-            for rep in range(num_replicates):
-                run_data.append({
-                    "Block": block + 1,
-                    "Run_ID": f"R{run_number:03d}",
-                    "Experiment": idx + 1,
-                    "Replicate": rep + 1,
-                    "Ionizable_%": round(ion_pct, 2),
-                    "Helper_%": round(helper_pct, 2),
-                    "Cholesterol_%": round(chol_pct, 2),
-                    "PEG_%": round(peg_pct, 2),
-                    "Ion_DNA_Target": ion_dna_ratio_target if ion_dna_ratio_target else "N/A",
-                    "NP_Ratio": round(np_ratio, 2),
-                    "Ionizable_Vol_uL": vol_dict["Ionizable_Vol_uL"],
-                    "Helper_Vol_uL": vol_dict["Helper_Vol_uL"],
-                    "Chol_Vol_uL": vol_dict["Chol_Vol_uL"],
-                    "PEG_Vol_uL": vol_dict["PEG_Vol_uL"],
-                    "Ethanol_Vol_uL": vol_dict["Ethanol_Vol_uL"],
-                    "DNA_Vol_uL": vol_dict["DNA_Vol_uL"],
-                    "Citrate_Vol_uL": vol_dict["Citrate_Vol_uL"],
-                    "Water_Vol_uL": vol_dict["Water_Vol_uL"],
-                    "Total_Vol_uL": vol_dict["Total_Vol_uL"],
-                    "Timestamp": datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
-                    "Notes": ""
-                })
-                run_number += 1
+    params = {
+        "mw_ion": mw_ion, "mw_helper": mw_helper, "mw_chol": mw_chol, "mw_peg": mw_peg,
+        "conc_ion": conc_ion, "conc_helper": conc_helper, "conc_chol": conc_chol, "conc_peg": conc_peg,
+        "dna_mass_ug": dna_mass_ug,
+        "dna_concentration": dna_concentration,
+        "ionizable_lipid_to_dna_ratio": ionizable_lipid_to_dna_ratio,
+        "aqueous_to_ethanol_ratio": aqueous_to_ethanol_ratio,
+        "ionizable_lipid_ratio": ionizable_lipid_ratio,
+        "helper_lipid_ratio": helper_lipid_ratio,
+        "cholesterol_ratio": cholesterol_ratio,
+        "pegdmg2000_ratio": pegdmg2000_ratio,
+        "amines_per_molecule": amines_per_molecule
+    }
     
-    return pd.DataFrame(run_data)
+    # Per-run parameters and volumes for every design point in one array pass
+    run_params = design_run_parameters(design_df.to_numpy(dtype=float), list(design_df.columns), params)
+    raw_volumes = run_volumes(run_params)
+    volumes = {key: np.round(value, 2) for key, value in raw_volumes.items() if key.endswith("_uL")}
+    amine_moles = raw_volumes["Ionizable_Moles"] * run_params["amines_per_molecule"]
+    phosphate_moles = run_params["dna_mass_ug"] / 330.0
+    np_ratio = np.round(np.where(phosphate_moles > 0, amine_moles / np.where(phosphate_moles > 0, phosphate_moles, 1.0), 0.0), 2)
+    
+    composition = np.column_stack([np.round(run_params[key], 2) for key in MOLAR_RATIO_PARAMS])
+    valid = (composition >= 0).all(axis=1)
+    process_columns = [f for f in design_df.columns if f in PROCESS_FACTORS and f != "Helper_%"]
+    # Split-plot designs: whole plots are numbered across blocks so every batch has its own ID
+    whole_plot = design_df["Whole_Plot"].to_numpy(dtype=int) if "Whole_Plot" in design_df.columns else None
+    
+    # Row order is block, then design point, then replicate: expand row indices instead of looping
+    valid_pos = np.flatnonzero(valid)
+    rows_per_block = len(valid_pos) * num_replicates
+    pos = np.tile(np.repeat(valid_pos, num_replicates), num_blocks)
+    block = np.repeat(np.arange(1, num_blocks + 1), rows_per_block)
+    
+    columns = {
+        "Block": block,
+        "Run_ID": format_run_ids(first_run_number, len(pos)),
+        "Experiment": design_df.index.to_numpy()[pos] + 1,
+        "Replicate": np.tile(np.arange(1, num_replicates + 1), len(valid_pos) * num_blocks),
+    }
+    if whole_plot is not None:
+        columns["Whole_Plot"] = (block - 1) * int(whole_plot.max()) + whole_plot[pos]
+    columns.update({
+        "Ionizable_%": composition[pos, 0],
+        "Helper_%": composition[pos, 1],
+        "Cholesterol_%": composition[pos, 2],
+        "PEG_%": composition[pos, 3],
+        "Ion_DNA_Target": run_params["ionizable_lipid_to_dna_ratio"][pos],
+        **{f: np.round(run_params[PROCESS_FACTORS[f][1]], 3)[pos] for f in process_columns},
+        "NP_Ratio": np_ratio[pos],
+        **{key: value[pos] for key, value in volumes.items()},
+        "Notes": "",
+    })
+    
+    run_sheet = pd.DataFrame(columns)
+    # One generation time for the whole sheet, kept as metadata rather than a per-row column
+    run_sheet.attrs["Generated"] = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+    return run_sheet
+
 
+with ion_dna_limit_slot:
+    st.markdown("**Pipetting Constraint**: lipid stock volumes must fit in the ethanol phase (Ethanol ≥ 0)")
+    ion_dna_limits = max_feasible_ion_dna_ratio(factor_ranges, volume_params)
+    if ion_dna_limits is not None:
+        ion_dna_safe, ion_dna_best = ion_dna_limits
+        col_lim1, col_lim2 = st.columns(2)
+        with col_lim1:
+            st.metric("Max Ion:DNA (all factor settings)", f"{ion_dna_safe:.2f}")
+        with col_lim2:
+            st.metric("Max Ion:DNA (best factor setting)", f"{ion_dna_best:.2f}")
+        
+        ion_dna_upper = factor_ranges.get("Ion_DNA_Ratio", (ionizable_lipid_to_dna_ratio, ionizable_lipid_to_dna_ratio))[1]
+        if ion_dna_upper > ion_dna_best:
+            st.warning(f"⚠️ Ion:DNA above {ion_dna_best:.2f} gives negative ethanol for every factor setting in range (upper limit is {ion_dna_upper:.1f}); raise stock concentrations or lower the Ion:DNA range.")
+        elif ion_dna_upper > ion_dna_safe:
+            st.info(f"💡 Ion:DNA above {ion_dna_safe:.2f} gives negative ethanol for some factor settings; those design points are pruned before the run sheet is built.")
 
 # ============================================================================
 # SECTION 3: STAGE 3 - OPTIMIZATION (设计生成与执行)
@@ -846,6 +3485,9 @@ if study_ion_dna:
     ion_dna_min, ion_dna_max = factor_ranges.get("Ion_DNA_Ratio", (5.0, 15.0))
     ranges["Ion_DNA_Ratio"] = (ion_dna_min, ion_dna_max)
 
+for factor in process_factors:
+    ranges[factor] = factor_ranges[factor]
+
 # Check range validity
 range_valid = True
 for factor_name, (min_val, max_val) in ranges.items():
@@ -856,28 +3498,206 @@ for factor_name, (min_val, max_val) in ranges.items():
 if not range_valid:
     st.stop()
 
+with design_stats_slot:
+    try:
+        with st.spinner("Evaluating design..."):
+            preview_df = cached_design(design_type, ranges, design_options)
+            preview_values = preview_df[list(ranges.keys())].to_numpy(dtype=float)
+            preview_values = preview_values[
+                composition_feasible_mask(preview_values, list(ranges.keys()), 0.5)
+                & volume_feasible_mask(preview_values, list(ranges.keys()), volume_params)
+            ]
+            diagnostics = design_diagnostics(
+                design_hash(preview_values), diagnostics_model, tuple(ranges.items()), tuple(ranges.keys()), preview_values
+            )
+        render_design_diagnostics(diagnostics, num_replicates, num_blocks)
+    except Exception as e:
+        st.warning(f"⚠️ Design statistics unavailable: {str(e)}")
+
+with design_compare_slot:
+    if st.button("⚖️ Compare All Designs", use_container_width=True,
+                 help="Generate every design type for the current ranges in parallel and rank them under the diagnostics model"):
+        try:
+            with st.spinner("Generating and scoring every design type..."):
+                st.session_state.design_comparison = (
+                    (tuple(ranges.items()), diagnostics_model), compare_designs(ranges, volume_params, diagnostics_model)
+                )
+        except Exception as e:
+            st.warning(f"⚠️ Design comparison unavailable: {str(e)}")
+    comparison_key, comparison = st.session_state.get("design_comparison", (None, None))
+    if comparison_key == (tuple(ranges.items()), diagnostics_model):
+        st.caption(f"Ranked by D-efficiency under the {diagnostics_model} model; max prediction variance is over the feasible region (σ² units). Default options for each design.")
+        st.dataframe(comparison.round(2), use_container_width=True, hide_index=True)
+
+with st.expander("🔋 Power Analysis: Replicates & Blocks", expanded=False):
+    st.markdown("""
+    Simulates thousands of experiments for the selected design to show how likely each model term is
+    to be detected (two-sided t-test) for a given number of replicates. Effect sizes are the response
+    change from the low to the high level of a factor, in the units of your response.
+    """)
+    
+    pw_col1, pw_col2, pw_col3 = st.columns(3)
+    with pw_col1:
+        power_model = st.selectbox(
+            "Model:",
+            options=["Linear", "Interactions", "Quadratic"],
+            index=1,
+            key="power_model"
+        )
+        power_alpha = st.number_input("Significance Level (α):", value=0.05, min_value=0.001, max_value=0.2, step=0.01, format="%.3f")
+    with pw_col2:
+        power_main = st.number_input("Main Effect Size:", value=10.0, min_value=0.0, step=1.0)
+        power_interaction = st.number_input("Interaction Effect Size:", value=5.0, min_value=0.0, step=1.0)
+        power_quadratic = st.number_input("Quadratic Effect Size:", value=5.0, min_value=0.0, step=1.0, disabled=(power_model != "Quadratic"))
+    with pw_col3:
+        power_noise = st.number_input("Noise SD (σ):", value=8.0, min_value=0.01, step=0.5, help="Run-to-run standard deviation of the response")
+        power_max_reps = st.slider("Replicates to Evaluate:", min_value=1, max_value=10, value=5)
+        power_target = st.slider("Target Power:", min_value=0.5, max_value=0.99, value=0.8, step=0.01)
+    
+    if st.button("⚡ Run Power Simulation", use_container_width=True):
+        try:
+            power_df = cached_design(design_type, ranges, design_options)
+            power_values = power_df[list(ranges.keys())].to_numpy(dtype=float)
+            power_values = power_values[
+                composition_feasible_mask(power_values, list(ranges.keys()), 0.5)
+                & volume_feasible_mask(power_values, list(ranges.keys()), volume_params)
+            ]
+            power_matrix, power_terms = build_model_matrix(power_values, list(ranges.keys()), ranges, power_model)
+            power_table = simulate_power(
+                power_matrix,
+                term_effect_sizes(power_terms, power_main, power_interaction, power_quadratic),
+                power_noise,
+                range(1, power_max_reps + 1),
+                num_blocks=int(num_blocks),
+                alpha=power_alpha
+            )
+            power_table.columns = power_terms
+            power_table = power_table.drop(columns="Intercept")
+            power_table.index.name = "Replicates"
+            
+            fig_power = go.Figure()
+            for term in power_table.columns:
+                fig_power.add_trace(go.Scatter(x=power_table.index, y=power_table[term], mode="lines+markers", name=term))
+            fig_power.add_hline(y=power_target, line_dash="dash", line_color="red")
+            fig_power.update_layout(
+                xaxis_title="Replicates per design point",
+                yaxis_title="Power",
+                yaxis_range=[0, 1.02],
+                height=400
+            )
+            st.plotly_chart(fig_power, use_container_width=True)
+            st.dataframe((power_table * 100).round(1).astype(str) + "%", use_container_width=True)
+            
+            sufficient = power_table.index[(power_table.min(axis=1) >= power_target).to_numpy()]
+            if len(sufficient) > 0:
+                st.success(f"✅ **{sufficient[0]} replicate(s)** × {int(num_blocks)} block(s) reach {power_target:.0%} power for every term ({len(power_values) * sufficient[0] * int(num_blocks)} runs).")
+            else:
+                st.warning(f"⚠️ {power_max_reps} replicates do not reach {power_target:.0%} power for every term. Increase replicates, use a larger design or reduce noise.")
+        except Exception as e:
+            st.error(f"❌ Power analysis failed: {str(e)}")
+
+with st.expander("🗂️ Formulation History: Skip Redundant Runs", expanded=False):
+    st.markdown("""
+    Upload earlier run sheets to compare every new design point with the formulations already tested
+    (runs with responses in this session are included automatically). Distances are measured on
+    Ionizable / Cholesterol / PEG %, Ion:DNA and aqueous:ethanol ratio, scaled by 10%, 10%, 2%, 10 and 1.
+    """)
+    history_files = st.file_uploader(
+        "Previous run sheets (CSV or Excel):",
+        type=["csv", "xlsx"],
+        accept_multiple_files=True,
+        key="history_upload"
+    )
+    hist_col1, hist_col2 = st.columns(2)
+    with hist_col1:
+        history_remove = st.checkbox("Remove near-duplicates of tested formulations", value=False)
+    with hist_col2:
+        history_threshold = st.number_input(
+            "Near-duplicate distance:",
+            value=0.05,
+            min_value=0.0,
+            step=0.01,
+            format="%.3f",
+            help="Design points closer than this to a tested formulation count as redundant (0.05 = 0.5% molar Ionizable)"
+        )
+    
+    history_tables = []
+    for history_file in history_files or []:
+        try:
+            table = pd.read_csv(history_file) if history_file.name.endswith(".csv") else pd.read_excel(history_file)
+            table["History_Label"] = history_file.name + " " + (table["Run_ID"].astype(str) if "Run_ID" in table else (table.index + 1).astype(str))
+            history_tables.append(table)
+        except Exception as e:
+            st.error(f"Error loading {history_file.name}: {e}")
+    if "run_sheet" in st.session_state and "response_data" in st.session_state:
+        session_responses = pd.to_numeric(st.session_state.response_data["Response"], errors="coerce").to_numpy(dtype=float)
+        if len(session_responses) == len(st.session_state.run_sheet) and (~np.isnan(session_responses)).any():
+            tested = st.session_state.run_sheet[~np.isnan(session_responses)].copy()
+            tested["History_Label"] = "This session " + tested["Run_ID"].astype(str)
+            history_tables.append(tested)
+    
+    history_tree, history_labels = None, None
+    if history_tables:
+        history_df = pd.concat(history_tables, ignore_index=True)
+        history_points = formulation_history_points(history_df, volume_params)
+        readable = np.isfinite(history_points).all(axis=1)
+        history_points, history_labels = history_points[readable], history_df["History_Label"].to_numpy()[readable]
+        history_tree = history_kd_tree(design_hash(history_points), history_points)
+        st.caption(f"📚 {len(history_points):,} tested formulations indexed")
+
 if st.button("🚀 Generate DOE Design & Run Sheet", type="primary", use_container_width=True):
     
     with st.spinner("Generating DOE design..."):
         try:
-            if design_type == "Full Factorial (2-Level)":
-                design_df = generate_2level_factorial(ranges)
-            elif design_type == "Full Factorial (3-Level)":
-                design_df = generate_3level_factorial(ranges)
-            elif design_type == "Fractional Factorial":
-                design_df = generate_fractional_factorial(ranges)
-            elif design_type == "Plackett-Burman":
-                design_df = generate_plackett_burman(ranges)
-            elif design_type == "Box-Behnken":
-                design_df = generate_box_behnken(ranges)
-            elif design_type == "Central Composite":
-                design_df = generate_central_composite(ranges)
-            elif design_type == "Mixture Design":
-                design_df = generate_mixture_design(ranges)
+            # Closed-form volume check at the vertices of the feasible region before any design work
+            vertex_check = volume_feasibility_vertices(ranges, volume_params, min_helper_pct=0.5)
+            if len(vertex_check) > 0 and not vertex_check["Volume_OK"].any():
+                raise ValueError(
+                    "every vertex of the feasible factor region needs more lipid stock than the ethanol phase holds, "
+                    "so no design point can have a non-negative ethanol volume. Lower the Ion:DNA range or raise stock concentrations."
+                )
+            box_volume_feasible = bool(vertex_check["Volume_OK"].all())
+            
+            design_df = cached_design(design_type, ranges, design_options)
+            for message in design_df.attrs.get("warnings", []):
+                st.warning(message)
+            if design_type == "Full Factorial (3-Level)":
+                st.info(f"🧮 Streamed {design_df.attrs['n_enumerated']:,} combinations; {len(design_df):,} pass the molar-sum and pipetting-volume checks.")
+            elif design_type == "Taguchi Orthogonal Array":
+                assignment = ", ".join(f"{f} → col {c}" for f, c in design_df.attrs["column_assignment"].items())
+                reserved = ", ".join(f"{pair} → col {'/'.join(map(str, cols))}" for pair, cols in design_df.attrs["interaction_columns"].items())
+                st.info(f"🧩 **{design_options['array']} column assignment**: {assignment}" + (f"  |  **Interactions**: {reserved}" if reserved else ""))
+            elif design_type == "I-Optimal (Prediction Variance)":
+                st.info(f"📉 Average prediction variance over the feasible region: **{design_df.attrs['avg_prediction_variance']:.4f}** σ²")
+            elif design_type == "Low-Discrepancy (Sobol/Halton)":
+                st.info(f"🔢 Sequence indices {design_options['skip']} – {design_df.attrs['next_skip'] - 1} used. To extend this screen later without repeats, start from index **{design_df.attrs['next_skip']}** with the same sequence, scrambling and seed.")
             
             # Filter invalid design points (where ratios sum > 100%)
             design_df = filter_valid_design_points(design_df, min_helper_pct=0.5)
             
+            # Prune points whose analytic ethanol/water volumes are negative before building the run sheet
+            if not box_volume_feasible and len(design_df) > 0:
+                volume_ok = volume_feasible_mask(design_df.to_numpy(dtype=float), list(design_df.columns), volume_params)
+                if not volume_ok.all():
+                    st.warning(f"⚠️ **Pipetting Constraint**: {int((~volume_ok).sum())} of {len(design_df)} design points removed because their lipid stock volumes exceed the ethanol phase (negative ethanol).")
+                    design_df = design_df[volume_ok].reset_index(drop=True)
+            
+            # Nearest previously tested formulation for every design point
+            nearest_tested = None
+            if history_tree is not None and len(history_labels) > 0 and len(design_df) > 0:
+                tested_distance, tested_index = kd_tree_nearest(history_tree, formulation_history_points(design_df, volume_params))
+                redundant = tested_distance < history_threshold
+                if history_remove and redundant.any():
+                    st.warning(f"⚠️ **Formulation History**: {int(redundant.sum())} of {len(design_df)} design points removed because a tested formulation lies within {history_threshold:g}.")
+                    design_df = design_df[~redundant].reset_index(drop=True)
+                    tested_distance, tested_index = tested_distance[~redundant], tested_index[~redundant]
+                elif redundant.any():
+                    st.info(f"🗂️ {int(redundant.sum())} of {len(design_df)} design points are within {history_threshold:g} of a tested formulation (see Nearest_Tested in the run sheet).")
+                nearest_tested = pd.DataFrame(
+                    {"Nearest_Tested": history_labels[tested_index], "Nearest_Distance": np.round(tested_distance, 4)},
+                    index=design_df.index + 1
+                )
+            
             # Check if we have any valid points left
             if len(design_df) == 0:
                 st.error("❌ No valid design points found! The specified ratio ranges are too wide and conflict with the requirement that all ratios sum to 100%. Please adjust your ranges.")
@@ -896,6 +3716,9 @@ if st.button("🚀 Generate DOE Design & Run Sheet", type="primary", use_contain
                     pegdmg2000_ratio=pegdmg2000_ratio,
                     amines_per_molecule=amines_per_molecule
                 )
+                if nearest_tested is not None:
+                    for column in nearest_tested.columns:
+                        run_sheet[column] = run_sheet["Experiment"].map(nearest_tested[column])
                 
                 # Check for negative Ethanol volumes
                 invalid_runs = run_sheet[run_sheet['Ethanol_Vol_uL'] < 0]
@@ -907,6 +3730,21 @@ if st.button("🚀 Generate DOE Design & Run Sheet", type="primary", use_contain
                     st.dataframe(invalid_summary, use_container_width=True, hide_index=True)
                     st.info("💡 **Cause**: The combination of high lipid concentrations and/or high Ion:DNA ratio requires too much ethanol, exceeding available space. Consider:\n- Reducing Ion:DNA ratio\n- Using lower lipid percentages\n- Increasing final LNP volume (dna_mass_ug)\n- Adjusting aqueous:ethanol ratio")
                 
+                # Run order: randomization, separated replicates or orthogonal blocking
+                design_blocks = None
+                if run_order_scheme == "Orthogonal blocks (CCD/BBD)":
+                    try:
+                        labels = orthogonal_block_labels(design_df, ranges)
+                        design_blocks = dict(zip(design_df.index + 1, labels))
+                    except ValueError as e:
+                        st.warning(f"⚠️ Run order: {str(e)}. Randomizing within blocks instead.")
+                valid_run_sheet = order_runs(
+                    valid_run_sheet,
+                    run_order_scheme if design_blocks is not None or run_order_scheme != "Orthogonal blocks (CCD/BBD)" else "Randomize within blocks",
+                    seed=int(run_order_seed),
+                    design_blocks=design_blocks
+                )
+                
                 # Store the valid design points for visualization
                 if len(valid_run_sheet) > 0:
                     # Get unique design points that are valid
@@ -916,10 +3754,18 @@ if st.button("🚀 Generate DOE Design & Run Sheet", type="primary", use_contain
                     st.session_state.design_df = valid_design_df
                     st.session_state.run_sheet = valid_run_sheet
                     st.session_state.design_type = design_type
+                    st.session_state.design_ranges = ranges
                     st.session_state.response_variable = response_variable
                     st.session_state.doe_objective = objective
                     st.session_state.num_replicates = num_replicates
                     st.session_state.num_blocks = num_blocks
+                    st.session_state.whole_plot_factors = list(design_options.get("whole_plot_factors", ()))
+                    
+                    # Keep every generated design so rounds can be merged later
+                    design_library = st.session_state.setdefault("design_library", {})
+                    design_library[f"DOE {len(design_library) + 1} ({design_type.split('(')[0].strip()})"] = {
+                        "design_df": valid_design_df, "ranges": dict(ranges)
+                    }
                     
                     st.success(f"""✅ **Design Generated Successfully!**
                     
@@ -991,7 +3837,9 @@ if "run_sheet" in st.session_state:
 
     
     design_display = design_df.copy()
-    design_display["Helper_%"] = 100.0 - design_display["Ionizable_%"] - design_display["Cholesterol_%"] - design_display["PEG_%"]
+    display_params = design_run_parameters(design_df.to_numpy(dtype=float), list(design_df.columns), volume_params)
+    for column, param_key in zip(MIXTURE_COMPONENTS, MOLAR_RATIO_PARAMS):
+        design_display[column] = display_params[param_key]
     
     st.dataframe(
         design_display.round(2),
@@ -1037,6 +3885,197 @@ if "run_sheet" in st.session_state:
     
     st.markdown("---")
     
+    with st.expander("➕ Augment Existing Design", expanded=False):
+        st.markdown("""
+        Build on the runs you already have instead of regenerating from scratch. Only the new runs are
+        computed; they are appended to the run sheet as a new block with fresh Run_IDs.
+        """)
+        
+        if "augment_message" in st.session_state:
+            st.success(st.session_state.pop("augment_message"))
+        
+        design_ranges = st.session_state.get("design_ranges", ranges)
+        augment_action = st.radio(
+            "Augmentation:",
+            options=["Full foldover", "Partial foldover", "Add axial points", "Add center points", "D-optimal augmentation"],
+            horizontal=True,
+            help="Foldover de-aliases effects, axial points turn a factorial into a CCD, center points add curvature and pure-error information"
+        )
+        
+        if augment_action == "Partial foldover":
+            foldover_factors = st.multiselect(
+                "Factors to reflect:",
+                options=list(design_ranges.keys()),
+                default=list(design_ranges.keys())[:1]
+            )
+        elif augment_action == "Add axial points":
+            augment_alpha_type = st.selectbox(
+                "Axial distance:",
+                options=["Face-centered (alpha = 1)", "Rotatable (alpha = F^1/4)"],
+                help="F is the number of factorial (corner) runs in the existing design"
+            )
+        elif augment_action == "Add center points":
+            augment_centers = st.number_input("Center points to add:", value=3, min_value=1, max_value=12)
+        elif augment_action == "D-optimal augmentation":
+            aug_col1, aug_col2 = st.columns(2)
+            with aug_col1:
+                augment_runs = st.number_input("Runs to add:", value=8, min_value=1, max_value=200)
+            with aug_col2:
+                augment_model = st.selectbox(
+                    "Model to support:",
+                    options=["Linear", "Interactions", "Quadratic", "Scheffé Quadratic"],
+                    index=2,
+                    key="augment_model"
+                )
+        
+        if st.button("➕ Append Runs", use_container_width=True):
+            try:
+                if augment_action == "Full foldover":
+                    new_points = foldover_runs(design_df, design_ranges)
+                elif augment_action == "Partial foldover":
+                    new_points = foldover_runs(design_df, design_ranges, factors=foldover_factors)
+                elif augment_action == "Add axial points":
+                    n_corner = int((np.abs(np.abs(encode_design(design_df, design_ranges)) - 1) < 1e-6).all(axis=1).sum())
+                    alpha = 1.0 if augment_alpha_type.startswith("Face") else max(n_corner, 1) ** 0.25
+                    new_points = axial_runs(design_ranges, alpha=alpha)
+                elif augment_action == "Add center points":
+                    new_points = center_runs(design_ranges, int(augment_centers))
+                else:
+                    new_points = d_optimal_augment_runs(
+                        design_df, design_ranges, int(augment_runs), model=augment_model, min_helper_pct=0.5
+                    )
+                
+                new_points = filter_valid_design_points(new_points, min_helper_pct=0.5)
+                new_points = new_points[
+                    volume_feasible_mask(new_points.to_numpy(dtype=float), list(new_points.columns), volume_params)
+                ].reset_index(drop=True)
+                if len(new_points) == 0:
+                    st.error("❌ None of the new runs satisfy the molar-ratio and pipetting-volume constraints.")
+                else:
+                    first_experiment = int(design_df.index.max()) + 1 if len(design_df) > 0 else 0
+                    new_points.index = range(first_experiment, first_experiment + len(new_points))
+                    last_run_number = int(run_sheet["Run_ID"].str[1:].astype(int).max())
+                    
+                    new_runs = generate_run_sheet(
+                        new_points, num_replicates, 1,
+                        mw_ionizable, mw_helper, mw_chol, mw_peg,
+                        conc_ionizable, conc_helper, conc_chol, conc_peg,
+                        dna_mass_ug=dna_mass_ug,
+                        dna_concentration=dna_concentration,
+                        ionizable_lipid_to_dna_ratio=ionizable_lipid_to_dna_ratio,
+                        aqueous_to_ethanol_ratio=aqueous_to_ethanol_ratio,
+                        ionizable_lipid_ratio=ionizable_lipid_ratio,
+                        helper_lipid_ratio=helper_lipid_ratio,
+                        cholesterol_ratio=cholesterol_ratio,
+                        pegdmg2000_ratio=pegdmg2000_ratio,
+                        amines_per_molecule=amines_per_molecule,
+                        first_run_number=last_run_number + 1
+                    )
+                    new_runs = new_runs[new_runs["Ethanol_Vol_uL"] >= 0].copy()
+                    new_runs["Block"] = int(run_sheet["Block"].max()) + 1
+                    new_runs = order_runs(
+                        new_runs,
+                        "Design order" if run_order_scheme == "Design order" else "Randomize within blocks",
+                        seed=int(run_order_seed),
+                        first_run_number=last_run_number + 1
+                    )
+                    new_points = new_points[new_points.index.isin(new_runs["Experiment"].unique() - 1)]
+                    
+                    st.session_state.design_df = pd.concat([design_df, new_points])
+                    st.session_state.run_sheet = pd.concat([run_sheet, new_runs], ignore_index=True)
+                    st.session_state.run_sheet.attrs = dict(run_sheet.attrs)
+                    if "response_data" in st.session_state:
+                        n_total = len(st.session_state.run_sheet)
+                        st.session_state.response_data = st.session_state.response_data.reindex(range(n_total))
+                        st.session_state.response_data["Run"] = range(1, n_total + 1)
+                    
+                    st.session_state.augment_message = (
+                        f"✅ **{augment_action}**: added {len(new_points)} design points "
+                        f"({len(new_runs)} runs) as block {int(new_runs['Block'].max()) if len(new_runs) else '-'}."
+                    )
+                    st.rerun()
+            except Exception as e:
+                st.error(f"❌ Error augmenting design: {str(e)}")
+    
+    with st.expander("🔗 Merge Designs & Remove Duplicates", expanded=False):
+        st.markdown("""
+        Combine designs generated in this session (e.g. a screening round plus a response-surface round) into one
+        run sheet. Formulations that agree within the tolerances below are run once, with replicates expanded once
+        per unique point; the **Sources** column records which design(s) each point came from.
+        """)
+        
+        if "merge_message" in st.session_state:
+            st.success(st.session_state.pop("merge_message"))
+        
+        design_library = st.session_state.get("design_library", {})
+        merge_sources = st.multiselect(
+            "Designs to merge:",
+            options=["Current design"] + list(design_library),
+            default=["Current design"] + list(design_library)[:-1],
+            help="The current design includes any augmentation runs; earlier designs are kept from each Generate"
+        )
+        merge_col1, merge_col2 = st.columns(2)
+        with merge_col1:
+            merge_molar_tol = st.number_input("Molar % tolerance:", value=0.01, min_value=0.0001, step=0.01, format="%.4f")
+        with merge_col2:
+            merge_ratio_tol = st.number_input("Mass ratio tolerance:", value=0.01, min_value=0.0001, step=0.01, format="%.4f")
+        
+        if st.button("🔗 Merge & Deduplicate", use_container_width=True, disabled=not merge_sources):
+            try:
+                sources = {name: design_df if name == "Current design" else design_library[name]["design_df"] for name in merge_sources}
+                merged = merge_designs(
+                    sources, volume_params,
+                    tolerances={**{c: merge_molar_tol for c in MIXTURE_COMPONENTS}, "Ion_DNA_Ratio": merge_ratio_tol}
+                )
+                factor_names = [f for f in merged.columns if f in DESIGN_FACTOR_PARAMS]
+                merged_ranges = {}
+                for name in merge_sources:
+                    for f, (low, high) in (st.session_state.design_ranges if name == "Current design" else design_library[name]["ranges"]).items():
+                        if f in factor_names:
+                            old_low, old_high = merged_ranges.get(f, (low, high))
+                            merged_ranges[f] = (min(low, old_low), max(high, old_high))
+                for f in factor_names:
+                    low, high = merged_ranges.get(f, (merged[f].min(), merged[f].max()))
+                    merged_ranges[f] = (min(low, merged[f].min()), max(high, merged[f].max()))
+                
+                merged_runs = generate_run_sheet(
+                    merged[factor_names], num_replicates, num_blocks,
+                    mw_ionizable, mw_helper, mw_chol, mw_peg,
+                    conc_ionizable, conc_helper, conc_chol, conc_peg,
+                    dna_mass_ug=dna_mass_ug,
+                    dna_concentration=dna_concentration,
+                    ionizable_lipid_to_dna_ratio=ionizable_lipid_to_dna_ratio,
+                    aqueous_to_ethanol_ratio=aqueous_to_ethanol_ratio,
+                    ionizable_lipid_ratio=ionizable_lipid_ratio,
+                    helper_lipid_ratio=helper_lipid_ratio,
+                    cholesterol_ratio=cholesterol_ratio,
+                    pegdmg2000_ratio=pegdmg2000_ratio,
+                    amines_per_molecule=amines_per_molecule
+                )
+                merged_runs = merged_runs[merged_runs["Ethanol_Vol_uL"] >= 0].copy()
+                merged_runs["Sources"] = merged_runs["Experiment"].map(dict(zip(merged.index + 1, merged["Sources"])))
+                merged_runs = order_runs(
+                    merged_runs,
+                    "Design order" if run_order_scheme == "Design order" else "Randomize within blocks",
+                    seed=int(run_order_seed)
+                )
+                
+                st.session_state.design_df = merged[factor_names][merged.index.isin(merged_runs["Experiment"].unique() - 1)]
+                st.session_state.run_sheet = merged_runs
+                st.session_state.design_type = "Merged Design"
+                st.session_state.design_ranges = merged_ranges
+                st.session_state.pop("response_data", None)
+                st.session_state.merge_message = (
+                    f"✅ Merged {merged.attrs['n_input']} design points from {len(merge_sources)} design(s) into "
+                    f"{len(merged)} unique formulations ({merged.attrs['n_input'] - len(merged)} duplicates removed); "
+                    f"{len(merged_runs)} runs."
+                )
+                st.rerun()
+            except Exception as e:
+                st.error(f"❌ Error merging designs: {str(e)}")
+    
+    st.markdown("---")
+    
     st.subheader("📊 Design Space Visualization")
     
     # Get design points from design_display (which corresponds to valid design_df)
@@ -1134,7 +4173,8 @@ if "run_sheet" in st.session_state:
     
     st.subheader("💾 Export & Download")
     
-    csv_data = run_sheet.to_csv(index=False)
+    # CSV has no metadata, so the generation time goes in as a constant column
+    csv_data = run_sheet.assign(Generated=run_sheet.attrs.get("Generated", "")).to_csv(index=False)
     timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
     
     col_csv, col_xlsx = st.columns(2)
@@ -1163,7 +4203,7 @@ if "run_sheet" in st.session_state:
                 "Parameter": ["DOE Objective", "Response Variable", "Design Type", "Design Points", "Replicates", "Blocks", "Total Runs", 
                              "Generated", "Ionizable MW", "Helper MW", "Chol MW", "PEG MW"],
                 "Value": [doe_objective, response_variable, design_type_used, len(design_df), num_replicates, num_blocks, len(run_sheet),
-                         datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
+                         run_sheet.attrs.get("Generated", datetime.now().strftime("%Y-%m-%d %H:%M:%S")),
                          mw_ionizable, mw_helper, mw_chol, mw_peg]
             }
             summary_df = pd.DataFrame(summary_data)
@@ -1236,6 +4276,34 @@ if "run_sheet" in st.session_state:
         valid_responses = response_df['Response'].dropna()
         st.info(f"📌 {len(valid_responses)}/{len(run_sheet)} runs have response values entered")
         
+        if "Whole_Plot" in run_sheet.columns:
+            st.markdown("**🧱 Split-Plot ANOVA** – whole-plot factors are tested against batch-to-batch error, subplot factors against within-batch error")
+            split_plot_model = st.selectbox("Split-Plot Model:", options=["Linear", "Interactions", "Quadratic"], index=1, key="split_plot_model")
+            if st.button("🧱 Run Split-Plot ANOVA", use_container_width=True):
+                responses = pd.to_numeric(response_df['Response'], errors="coerce").to_numpy(dtype=float)
+                if len(responses) != len(run_sheet):
+                    st.warning("⚠️ The response table does not match the current run sheet; re-enter the responses for this design.")
+                else:
+                    has_response = ~np.isnan(responses)
+                    design_ranges = st.session_state.design_ranges
+                    runs = run_sheet[has_response]
+                    try:
+                        anova_table, variance_components = split_plot_anova(
+                            design_df.loc[runs['Experiment'] - 1, list(design_ranges)].to_numpy(dtype=float),
+                            list(design_ranges), design_ranges, runs['Whole_Plot'].to_numpy(),
+                            st.session_state.get("whole_plot_factors", []), responses[has_response], split_plot_model
+                        )
+                        st.dataframe(anova_table.round(4), use_container_width=True, hide_index=True)
+                        vc_col1, vc_col2 = st.columns(2)
+                        with vc_col1:
+                            st.metric("Whole-Plot Variance (σ²_WP)", f"{variance_components['Whole plot']:.4g}")
+                        with vc_col2:
+                            st.metric("Subplot Variance (σ²_SP)", f"{variance_components['Subplot']:.4g}")
+                        if anova_table.loc[anova_table['Source'] == "Whole plot error", 'df'].iloc[0] < 1:
+                            st.warning("⚠️ No whole-plot error degrees of freedom: replicate whole plots to test hard-to-change factors.")
+                    except Exception as e:
+                        st.error(f"❌ Split-plot ANOVA failed: {str(e)}")
+        
         # Analysis button
         col_analyze1, col_analyze2 = st.columns([1, 1])
         
@@ -1465,6 +4533,97 @@ if "run_sheet" in st.session_state:
                 use_container_width=True
             )
     
+    with st.expander("🤖 Batch Bayesian Optimization: Propose the Next Plate", expanded=False):
+        st.markdown("""
+        Fits a Gaussian-process model to the responses entered above and proposes a batch of new feasible
+        formulations with high expected improvement, spread out by local penalization. New responses update
+        the model incrementally; append the plate to the run sheet to keep the loop going.
+        """)
+        
+        if "bo_message" in st.session_state:
+            st.success(st.session_state.pop("bo_message"))
+        
+        bo_col1, bo_col2, bo_col3 = st.columns(3)
+        with bo_col1:
+            bo_goal = st.radio("Goal:", options=["Maximize", "Minimize"], index=1 if "Size" in response_variable else 0, horizontal=True)
+        with bo_col2:
+            bo_batch_size = st.number_input("Formulations to Propose:", value=24, min_value=8, max_value=96, step=8)
+        with bo_col3:
+            bo_refit = st.checkbox("Re-select GP hyperparameters", value=False,
+                                   help="Refit length scale and noise from scratch instead of updating the existing model with new runs")
+        
+        if st.button("🤖 Propose Next Plate", use_container_width=True):
+            responses = pd.to_numeric(st.session_state.get("response_data", pd.DataFrame({"Response": []}))["Response"], errors="coerce").to_numpy(dtype=float)
+            design_ranges = st.session_state.design_ranges
+            if len(responses) != len(run_sheet):
+                st.warning("⚠️ The response table does not match the current run sheet; re-enter the responses for this design.")
+            elif (~np.isnan(responses)).sum() < 3:
+                st.warning("⚠️ Enter at least 3 responses before proposing new formulations.")
+            else:
+                try:
+                    observed = run_sheet[~np.isnan(responses)]
+                    bounds = np.array([design_ranges[f] for f in design_ranges], dtype=float)
+                    X_observed = (design_df.loc[observed["Experiment"] - 1, list(design_ranges)].to_numpy(dtype=float) - bounds.mean(axis=1)) \
+                        / ((bounds[:, 1] - bounds[:, 0]) / 2)
+                    previous = st.session_state.get("bo_gp")
+                    if bo_refit or previous is None or previous.get("ranges") != design_ranges:
+                        previous = None
+                    n_previous = len(previous["keys"]) if previous is not None else 0
+                    gp = gp_posterior(observed["Run_ID"].tolist(), X_observed, responses[~np.isnan(responses)], previous)
+                    st.session_state.bo_gp = {**gp, "ranges": design_ranges}
+                    
+                    proposals = propose_bayesian_batch(gp, design_ranges, volume_params, int(bo_batch_size),
+                                                       maximize=(bo_goal == "Maximize"), seed=len(gp["keys"]))
+                    st.session_state.bo_proposals = proposals
+                    fit_note = (f"updated incrementally with {len(gp['keys']) - n_previous} new runs" if previous is not None
+                                else "hyperparameters selected by marginal likelihood")
+                    st.info(f"📐 GP on {len(gp['keys'])} runs ({fit_note}): length scale {gp['length_scale']:g} (coded units), "
+                            f"noise variance {gp['noise_var']:g} (standardized).")
+                except Exception as e:
+                    st.error(f"❌ Bayesian optimization failed: {str(e)}")
+        
+        if "bo_proposals" in st.session_state:
+            proposals = st.session_state.bo_proposals
+            factor_names = [f for f in proposals.columns if f in DESIGN_FACTOR_PARAMS]
+            last_run_number = int(run_sheet["Run_ID"].str[1:].astype(int).max())
+            plate = generate_run_sheet(
+                proposals[factor_names], 1, 1,
+                mw_ionizable, mw_helper, mw_chol, mw_peg,
+                conc_ionizable, conc_helper, conc_chol, conc_peg,
+                dna_mass_ug=dna_mass_ug,
+                dna_concentration=dna_concentration,
+                ionizable_lipid_to_dna_ratio=ionizable_lipid_to_dna_ratio,
+                aqueous_to_ethanol_ratio=aqueous_to_ethanol_ratio,
+                ionizable_lipid_ratio=ionizable_lipid_ratio,
+                helper_lipid_ratio=helper_lipid_ratio,
+                cholesterol_ratio=cholesterol_ratio,
+                pegdmg2000_ratio=pegdmg2000_ratio,
+                amines_per_molecule=amines_per_molecule,
+                first_run_number=last_run_number + 1
+            )
+            plate["Predicted_Mean"] = proposals["Predicted_Mean"].round(3).to_numpy()
+            plate["Predicted_SD"] = proposals["Predicted_SD"].round(3).to_numpy()
+            st.dataframe(plate, use_container_width=True, hide_index=True)
+            
+            if st.button("➕ Append Plate to Run Sheet", use_container_width=True):
+                first_experiment = int(design_df.index.max()) + 1 if len(design_df) > 0 else 0
+                new_points = proposals[factor_names].copy()
+                new_points.index = range(first_experiment, first_experiment + len(new_points))
+                plate["Experiment"] = new_points.index.to_numpy() + 1
+                plate["Block"] = int(run_sheet["Block"].max()) + 1
+                plate = plate.drop(columns=["Predicted_Mean", "Predicted_SD"])
+                
+                st.session_state.design_df = pd.concat([design_df, new_points])
+                st.session_state.run_sheet = pd.concat([run_sheet, plate], ignore_index=True)
+                st.session_state.run_sheet.attrs = dict(run_sheet.attrs)
+                if "response_data" in st.session_state:
+                    n_total = len(st.session_state.run_sheet)
+                    st.session_state.response_data = st.session_state.response_data.reindex(range(n_total))
+                    st.session_state.response_data["Run"] = range(1, n_total + 1)
+                del st.session_state.bo_proposals
+                st.session_state.bo_message = f"✅ Appended {len(plate)} proposed formulations as block {int(plate['Block'].max())}."
+                st.rerun()
+    
     st.markdown("---")
     
     st.subheader("📈 Experimental Design Statistics")